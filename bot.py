@@ -1,9 +1,28 @@
 from config import TOKEN, ADMIN_IDS
 
 # -*- coding: utf-8 -*-
-from config import TOKEN
-from db import init_db
+import asyncio
+import functools
 
+from config import (
+    TOKEN,
+    ARCHIVE_INTERVAL_MINUTES,
+    BOT_MODE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS,
+    UPDATE_CONCURRENCY,
+    UPDATE_MAX_PENDING,
+    WORKERS,
+    PERSISTENCE_INTERVAL,
+    PERSISTENCE_MAX_AGE_DAYS,
+)
+from db import init_db, close_pool
+import db_async
+
+from telegram import Update
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -30,18 +49,41 @@ from handlers.orders import (
     confirm_buttons,
     cancel,
     my_orders,
+    my_orders_page,
     user_view_order,
 )
 from handlers.admin import (
     admin_menu_buttons,
+    admin_orders_page,
     admin_view_order,
     admin_set_status,
+    search_start,
+    got_search_query,
+    search_cancel,
+    export_orders_command,
+    stats_command,
+    update_stats_command,
+    today_orders_command,
+    orders_between_command,
+    admin_order_timeline,
+    sla_command,
 )
 from handlers.cart import (
     show_cart,
     cart_modify,
 )
-from handlers.products import add_test_product
+from handlers.products import (
+    add_test_product,
+    cache_stats,
+    import_products_help,
+    import_products_file,
+)
+from services.archiver import archive_loop
+from services.webhook import WebhookServer, register_webhook
+from services.lifecycle import serve, stop_on_signals
+from services.persistence import SqlitePersistence, persistence_enabled
+from services.update_processor import PerUserUpdateProcessor
+from services.workers import run_worker_pool
 
 # ===================== utils =====================
 from utils.constants import (
@@ -55,12 +97,85 @@ from utils.constants import (
     ADDRESS_NOTE,
     DESC,
     CONFIRM,
+    SEARCH_QUERY,
 )
 
+# ===================== lifecycle =====================
+_background_tasks = []
+
+
+async def on_startup(app: Application, archive: bool = True):
+    db_async.write_queue.start()
+    # در حالت چندپردازه‌ای فقط یکی از workerها بایگانی می‌کند
+    if archive and ARCHIVE_INTERVAL_MINUTES > 0:
+        _background_tasks.append(asyncio.create_task(archive_loop()))
+
+
+async def on_stop(app: Application):
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    # نوشتن‌های باقی‌مانده در صف قبل از بستن اتصال‌ها
+    await db_async.write_queue.stop()
+
+
+async def on_shutdown(app: Application):
+    db_async.shutdown()
+    close_pool()
+
+
+# ===================== webhook =====================
+async def run_webhook(app: Application):
+    """
+    آپدیت‌ها از WebhookServer به app.update_queue می‌رسند.
+    اگر WEBHOOK_URL خالی باشد setWebhook صدا زده نمی‌شود (تست محلی).
+    """
+
+    async def on_update(payload: dict):
+        await app.update_queue.put(Update.de_json(payload, app.bot))
+
+    server = WebhookServer(
+        on_update,
+        WEBHOOK_LISTEN,
+        WEBHOOK_PORT,
+        WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+    )
+
+    async def start_ingress():
+        await server.start()
+        await register_webhook(app.bot)
+
+    stop_event = asyncio.Event()
+    stop_on_signals(stop_event)
+    await serve(app, stop_event, start_ingress, server.stop)
+
+
 # ===================== main =====================
-def main():
-    init_db()
-    app = Application.builder().token(TOKEN).build()
+def build_application(archive: bool = True, owns_user=None) -> Application:
+    """
+    Application با همه‌ی هندلرها؛ archive=False برای workerهای غیر اول.
+    owns_user: در حالت چندپردازه‌ای فقط گفتگوهای کاربرهای همین worker بارگذاری می‌شوند.
+    """
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .post_init(functools.partial(on_startup, archive=archive))
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if UPDATE_CONCURRENCY > 1:
+        builder = builder.concurrent_updates(
+            PerUserUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_MAX_PENDING)
+        )
+    persistent = persistence_enabled()
+    if persistent:
+        builder = builder.persistence(
+            SqlitePersistence(PERSISTENCE_INTERVAL, PERSISTENCE_MAX_AGE_DAYS, owns_user)
+        )
+    app = builder.build()
 
     conv = ConversationHandler(
         entry_points=[
@@ -113,6 +228,8 @@ def main():
             CONFIRM: [CallbackQueryHandler(confirm_buttons)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="checkout",
+        persistent=persistent,
     )
 
     # ----- ثبت هندلرها -----
@@ -127,23 +244,65 @@ def main():
         )
     )
 
+    search_conv = ConversationHandler(
+        entry_points=[
+            CommandHandler("search", search_start),
+            MessageHandler(
+                filters.TEXT & ~filters.COMMAND & filters.Regex(r"^جستجوی سفارش$"),
+                search_start,
+            ),
+        ],
+        states={
+            SEARCH_QUERY: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, got_search_query),
+            ],
+        },
+        fallbacks=[CommandHandler("cancel", search_cancel)],
+        name="order_search",
+        persistent=persistent,
+    )
+    app.add_handler(search_conv)
+
     app.add_handler(
         MessageHandler(
             filters.TEXT
             & ~filters.COMMAND
             & filters.Regex(
-                r"^(لیست همه سفارشات|لیست آخرین سفارشات|سفارشات تعیین وضعیت نشده)$"
+                r"^(لیست همه سفارشات|لیست آخرین سفارشات|سفارشات تعیین وضعیت نشده|سفارشات امروز)$"
             ),
             admin_menu_buttons,
         )
     )
 
+    app.add_handler(
+        CallbackQueryHandler(
+            admin_orders_page,
+            pattern=r"^orders_page:(all|new|search|today|range):(older|newer):\d+$",
+        )
+    )
+    app.add_handler(CommandHandler("export", export_orders_command))
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CommandHandler("update_stats", update_stats_command))
+    app.add_handler(CommandHandler("today", today_orders_command))
+    app.add_handler(CommandHandler("orders_between", orders_between_command))
+    app.add_handler(CommandHandler("sla", sla_command))
     app.add_handler(CallbackQueryHandler(admin_view_order, pattern=r"^view_order:\d+$"))
+    app.add_handler(
+        CallbackQueryHandler(admin_order_timeline, pattern=r"^order_timeline:\d+$")
+    )
     app.add_handler(
         CallbackQueryHandler(admin_set_status, pattern=r"^set_status:\d+:.+$")
     )
 
     app.add_handler(CommandHandler("add_test_product", add_test_product))
+    app.add_handler(CommandHandler("cache_stats", cache_stats))
+    app.add_handler(CommandHandler("import_products", import_products_help))
+    app.add_handler(
+        MessageHandler(
+            filters.Document.ALL & filters.CaptionRegex(r"^/import_products"),
+            import_products_file,
+        )
+    )
 
     app.add_handler(CallbackQueryHandler(show_cart, pattern=r"^view_cart$"))
     app.add_handler(
@@ -153,9 +312,33 @@ def main():
     app.add_handler(
         CallbackQueryHandler(user_view_order, pattern=r"^user_view_order:\d+$")
     )
+    app.add_handler(
+        CallbackQueryHandler(my_orders_page, pattern=r"^my_orders_page:(older|newer):\d+$")
+    )
+
+    return app
+
+
+def main():
+    init_db()
+
+    if WORKERS > 1:
+        # یک پردازه‌ی ورودی + WORKERS پردازه‌ی worker (services/workers.py)؛
+        # پردازه‌ی ورودی خودش به دیتابیس کاری ندارد
+        close_pool()
+        print(f"Bot is running with {WORKERS} workers...")
+        run_worker_pool(WORKERS)
+        return
 
+    app = build_application()
     print("Bot is running...")
-    app.run_polling()
+    if BOT_MODE == "webhook":
+        try:
+            asyncio.run(run_webhook(app))
+        except KeyboardInterrupt:
+            pass
+    else:
+        app.run_polling()
 
 
 if __name__ == "__main__":
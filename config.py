@@ -11,3 +11,73 @@ for x in raw_admins.split(","):
     x = x.strip()
     if x.isdigit():
         ADMIN_IDS.add(int(x))
+
+# تعداد تردهای مخصوص دیتابیس (کوئری‌ها بیرون از event loop اجرا می‌شوند)
+DB_WORKERS = int(os.environ.get("DB_WORKERS", "4"))
+
+# تنظیمات SQLite
+DB_PATH = os.environ.get("DB_PATH", "orders.db")
+DB_READERS = int(os.environ.get("DB_READERS", "4"))
+DB_CACHE_KB = int(os.environ.get("DB_CACHE_KB", "16384"))
+DB_MMAP_MB = int(os.environ.get("DB_MMAP_MB", "128"))
+
+# کش محصولات (بر اساس code و id)
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE", "1024"))
+PRODUCT_CACHE_TTL = int(os.environ.get("PRODUCT_CACHE_TTL", "300"))
+
+# کش متن جزئیات سفارش (با تغییر وضعیت باطل می‌شود)
+ORDER_TEXT_CACHE_SIZE = int(os.environ.get("ORDER_TEXT_CACHE_SIZE", "2048"))
+ORDER_TEXT_CACHE_TTL = int(os.environ.get("ORDER_TEXT_CACHE_TTL", "600"))
+
+# بایگانی سفارش‌های تمام‌شده (done/canceled) در یک فایل جدا
+ARCHIVE_DB_PATH = os.environ.get("ARCHIVE_DB_PATH", "orders_archive.db")
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+# هر چند دقیقه یک بار اجرا شود (۰ = خاموش)
+ARCHIVE_INTERVAL_MINUTES = int(os.environ.get("ARCHIVE_INTERVAL_MINUTES", "60"))
+
+# لایه‌ی ذخیره‌سازی هندلرها: sqlite (پیش‌فرض) یا memory (فقط برای بنچمارک)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite")
+
+# خروجی سفارش‌ها برای ادمین: تعداد ردیف در هر تکه‌ی کوئری
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "500"))
+
+# group commit: نوشتن‌های سبد و سفارش از صف، چند عملیات در یک تراکنش
+# WRITE_BATCH_MAX = حداکثر عملیات در هر تراکنش (۱ = خاموش، هر نوشتن تراکنش جدا)
+# WRITE_BATCH_LATENCY_MS = حداکثر صبر برای جمع شدن دسته
+WRITE_BATCH_MAX = int(os.environ.get("WRITE_BATCH_MAX", "64"))
+WRITE_BATCH_LATENCY_MS = float(os.environ.get("WRITE_BATCH_LATENCY_MS", "5"))
+
+# نحوه‌ی دریافت آپدیت‌ها: polling (پیش‌فرض) یا webhook
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+# سرور HTTP داخلی حالت webhook (معمولاً پشت reverse proxy روی localhost)
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+# هدر X-Telegram-Bot-Api-Secret-Token (خالی = بدون چک)
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+# آدرس عمومی کامل (https://example.com/telegram) برای setWebhook؛
+# خالی = ثبت نمی‌شود (برای تست محلی با POST کردن Update JSON)
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+
+# پردازش هم‌زمان آپدیت‌ها (ترتیب آپدیت‌های هر کاربر حفظ می‌شود)
+# UPDATE_CONCURRENCY = حداکثر هندلرهای هم‌زمان (۱ = ترتیبی مثل قبل)
+# UPDATE_MAX_PENDING = حداکثر آپدیت‌های منتظر + در حال اجرا
+UPDATE_CONCURRENCY = int(os.environ.get("UPDATE_CONCURRENCY", "16"))
+UPDATE_MAX_PENDING = int(os.environ.get("UPDATE_MAX_PENDING", "1000"))
+
+# ذخیره‌ی گفتگوهای نیمه‌کاره (user_data + مرحله‌ی ثبت سفارش) در دیتابیس تا با
+# ری‌استارت از دست نروند؛ تغییرها هر چند ثانیه یک بار نوشته می‌شوند (۰ = خاموش)
+PERSISTENCE_INTERVAL = float(os.environ.get("PERSISTENCE_INTERVAL", "5"))
+# گفتگوهایی که این‌قدر (روز) دست نخورده‌اند هنگام شروع پاک می‌شوند
+PERSISTENCE_MAX_AGE_DAYS = int(os.environ.get("PERSISTENCE_MAX_AGE_DAYS", "7"))
+
+# تعداد پردازه‌های worker (۱ = یک پردازه مثل قبل). با بیشتر از ۱، پردازه‌ی اصلی
+# فقط آپدیت‌ها را (polling یا webhook) می‌گیرد و بر اساس user_id بین workerها پخش می‌کند.
+WORKERS = int(os.environ.get("WORKERS", "1"))
+# کش‌ها بین پردازه‌ها باطل نمی‌شوند؛ در حالت چندپردازه‌ای TTL آن‌ها کوتاه می‌شود
+WORKER_CACHE_TTL = int(os.environ.get("WORKER_CACHE_TTL", "30"))
+if WORKERS > 1:
+    PRODUCT_CACHE_TTL = min(PRODUCT_CACHE_TTL, WORKER_CACHE_TTL)
+    ORDER_TEXT_CACHE_TTL = min(ORDER_TEXT_CACHE_TTL, WORKER_CACHE_TTL)
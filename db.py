@@ -1,69 +1,213 @@
+import itertools
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 
-DB_PATH = "orders.db"
+from migrations import migrate
+from utils.cache import TTLCache, MISSING
+from utils.validators import normalize_digits
+from utils.timeutils import to_ts, now_ts, local_day, local_today, day_range
+from models import OrderSummary, OrderDetail, OrderItem, CartLine, Product, StatusEvent
+from config import (
+    DB_PATH,
+    DB_READERS,
+    DB_CACHE_KB,
+    DB_MMAP_MB,
+    PRODUCT_CACHE_SIZE,
+    PRODUCT_CACHE_TTL,
+    ARCHIVE_DB_PATH,
+    ORDER_TEXT_CACHE_SIZE,
+    ORDER_TEXT_CACHE_TTL,
+)
 
 
-def get_conn():
-    return sqlite3.connect(DB_PATH)
+# ---------------- اتصال‌ها ----------------
+# یک اتصال نویسنده (با قفل) + چند اتصال خواننده که در کل عمر برنامه باز می‌مانند.
+# در حالت WAL خواننده‌ها هم‌زمان با نویسنده کار می‌کنند.
+
+_pool_lock = threading.Lock()
+_write_lock = threading.Lock()
+_writer = None
+_readers = None
+
+
+def _connect(read_only: bool = False):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    if not read_only:
+        # نویسنده تراکنش‌هایش را خودش (BEGIN IMMEDIATE در write_conn) باز می‌کند
+        conn.isolation_level = None
+    # فایل بایگانی روی همه‌ی اتصال‌ها attach می‌شود تا get_order بتواند به آن برگردد
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DB_PATH,))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA archive.journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_MB * 1024 * 1024}")
+    if read_only:
+        conn.execute("PRAGMA query_only=1")
+    # مهاجرت‌های جستجو (۵ و ۱۰) ارقام فارسی/عربی را با این تابع یکدست می‌کنند؛
+    # تریگرها به آن وابسته نیستند تا نویسنده‌های بیرونی هم کار کنند
+    conn.create_function("normalize_digits", 1, normalize_digits, deterministic=True)
+    # روز به وقت تهران برای جدول‌های آمار روزانه
+    conn.create_function("local_day", 1, local_day, deterministic=True)
+    return conn
+
+
+def _ensure_pool():
+    global _writer, _readers
+    if _writer is not None:
+        return
+    with _pool_lock:
+        if _writer is not None:
+            return
+        writer = _connect()
+        readers = queue.Queue()
+        for _ in range(max(1, DB_READERS)):
+            readers.put(_connect(read_only=True))
+        _readers = readers
+        _writer = writer
+
+
+@contextmanager
+def read_conn():
+    """یک اتصال خواننده از pool قرض می‌گیرد و بعد از کار برمی‌گرداند."""
+    _ensure_pool()
+    conn = _readers.get()
+    try:
+        yield conn
+    finally:
+        _readers.put(conn)
+
+
+@contextmanager
+def write_conn():
+    """
+    اتصال نویسنده داخل یک تراکنش BEGIN IMMEDIATE؛ در پایان commit و در صورت
+    خطا rollback می‌شود.
+
+    IMMEDIATE قفل نوشتن را از همان اول تراکنش می‌گیرد. با چند پردازه روی یک فایل
+    (services/workers.py) تراکنش deferred ای که اول می‌خواند و بعد می‌نویسد
+    (checkout، تغییر وضعیت)، اگر پردازه‌ی دیگری وسطش commit کند، بدون صبر
+    (busy_timeout) با SQLITE_BUSY شکست می‌خورد؛ این‌جا منتظر قفل می‌ماند.
+    """
+    _ensure_pool()
+    with _write_lock:
+        _writer.execute("BEGIN IMMEDIATE")
+        try:
+            yield _writer
+            _writer.commit()
+        except BaseException:
+            _writer.rollback()
+            raise
+
+
+def close_pool():
+    """بستن همه‌ی اتصال‌ها هنگام خاموش شدن ربات."""
+    global _writer, _readers
+    with _pool_lock:
+        if _writer is None:
+            return
+        with _write_lock:
+            try:
+                _writer.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            _writer.close()
+        while True:
+            try:
+                _readers.get_nowait().close()
+            except queue.Empty:
+                break
+        _writer = None
+        _readers = None
+
+
+def _after_commit(op, args, kwargs):
+    # مثلاً باطل کردن کش‌ها؛ فقط بعد از commit تا خواننده‌ها داده‌ی قدیمی را دوباره کش نکنند
+    hook = getattr(op, "after_commit", None)
+    if hook is not None:
+        hook(*args, **kwargs)
+
+
+def run_write(op, *args, **kwargs):
+    """اجرای یک عملیات نوشتن op(cur, ...) در تراکنش خودش."""
+    with write_conn() as conn:
+        result = op(conn.cursor(), *args, **kwargs)
+    _after_commit(op, args, kwargs)
+    return result
+
+
+def run_write_batch(ops):
+    """
+    چند عملیات نوشتن در یک تراکنش (group commit): یک commit و یک fsync برای همه.
+    هر عملیات داخل SAVEPOINT خودش اجرا می‌شود تا خطای یکی بقیه را خراب نکند.
+    ops: لیست (op, args, kwargs)
+    برمی‌گرداند: لیست (ok, نتیجه یا exception) به همان ترتیب
+    """
+    results = []
+    with write_conn() as conn:
+        cur = conn.cursor()
+        for op, args, kwargs in ops:
+            cur.execute("SAVEPOINT write_op")
+            try:
+                result = op(cur, *args, **kwargs)
+            except Exception as e:
+                cur.execute("ROLLBACK TO write_op")
+                cur.execute("RELEASE write_op")
+                results.append((False, e))
+            else:
+                cur.execute("RELEASE write_op")
+                results.append((True, result))
+
+    for (op, args, kwargs), (ok, _) in zip(ops, results):
+        if ok:
+            _after_commit(op, args, kwargs)
+    return results
 
 
 def init_db():
-    with get_conn() as conn:
-        c = conn.cursor()
-
-        # جدول سفارش‌ها
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            national_id TEXT NOT NULL,
-            full_name TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            address TEXT NOT NULL,
-            description TEXT,
-            status TEXT NOT NULL DEFAULT 'new',
-            created_at TEXT NOT NULL
-        );
-        """)
-
-        # جدول محصولات
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            code TEXT NOT NULL UNIQUE,
-            title TEXT NOT NULL,
-            price INTEGER NOT NULL,
-            is_active INTEGER NOT NULL DEFAULT 1
-        );
-        """)
-
-        # جدول سبد خرید
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS cart (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            product_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL
-        );
-        """)
-
-        # جدول آیتم‌های هر سفارش
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS order_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER NOT NULL,
-            product_title TEXT NOT NULL,
-            quantity INTEGER NOT NULL,
-            price INTEGER NOT NULL
-        );
-        """)
-
-        conn.commit()
+    """ساخت دیتابیس یا به‌روزرسانی اسکیمای یک فایل موجود تا آخرین نسخه."""
+    with write_conn() as conn:
+        # migrate تراکنش باز را commit می‌کند و برای هر مهاجرت تراکنش خودش را دارد
+        migrate(conn)
+    with write_conn() as conn:
+        _sync_archive_schema(conn)
 
 
 # ---------------- سفارش‌ها ----------------
 
+def _insert_order(
+    cur, user_id, national_id, full_name, phone, address, description,
+    total_amount=0, item_count=0,
+):
+    now = datetime.utcnow()
+    created_ts = to_ts(now)
+    # ستون‌های قابل جستجو همین‌جا یکدست می‌شوند؛ تریگر orders_fts فقط کپی می‌کند
+    full_name, phone, national_id, address = (
+        normalize_digits(value) for value in (full_name, phone, national_id, address)
+    )
+    if description is not None:
+        description = normalize_digits(description)
+    cur.execute("""
+    INSERT INTO orders (
+        user_id, national_id, full_name, phone, address, description,
+        status, created_at, created_ts, total_amount, item_count
+    )
+    VALUES (?, ?, ?, ?, ?, ?, 'new', ?, ?, ?, ?)
+    """, (
+        user_id, national_id, full_name, phone, address, description,
+        now.isoformat(), created_ts, total_amount, item_count,
+    ))
+    order_id = cur.lastrowid
+    _add_status_event(cur, order_id, None, "new", created_ts)
+    _bump_order_stats(cur, local_day(created_ts), "new", 1, total_amount, item_count)
+    return order_id
+
+
 def create_order(
     user_id: int,
     national_id: str,
@@ -72,51 +216,281 @@ def create_order(
     address: str,
     description: str
 ):
-    with get_conn() as conn:
-        cur = conn.cursor()
+    return run_write(_insert_order, user_id, national_id, full_name, phone, address, description)
+
+
+def _checkout(
+    cur,
+    user_id: int,
+    national_id: str,
+    full_name: str,
+    phone: str,
+    address: str,
+    description: str,
+    from_cart: bool = True,
+):
+    total, item_count = 0, 0
+    if from_cart:
         cur.execute("""
-        INSERT INTO orders (user_id, national_id, full_name, phone, address, description, status, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, 'new', ?)
-        """, (user_id, national_id, full_name, phone, address, description, datetime.utcnow().isoformat()))
-        conn.commit()
-        return cur.lastrowid
+            SELECT COALESCE(SUM(c.quantity * p.price), 0), COALESCE(SUM(c.quantity), 0)
+            FROM cart c
+            JOIN products p ON c.product_id = p.id
+            WHERE c.user_id=?
+        """, (user_id,))
+        total, item_count = cur.fetchone()
 
+    order_id = _insert_order(
+        cur, user_id, national_id, full_name, phone, address, description,
+        total, item_count,
+    )
 
-def list_orders(limit: int = 20, offset: int = 0):
-    with get_conn() as conn:
-        cur = conn.cursor()
+    if from_cart:
         cur.execute("""
-            SELECT id, user_id, national_id, full_name, phone, address, description, status, created_at
-            FROM orders
-            ORDER BY id DESC
-            LIMIT ? OFFSET ?
-        """, (limit, offset))
-        return cur.fetchall()
+            INSERT INTO order_items (order_id, product_title, quantity, price)
+            SELECT ?, p.title, c.quantity, p.price
+            FROM cart c
+            JOIN products p ON c.product_id = p.id
+            WHERE c.user_id=?
+            ORDER BY c.id ASC
+        """, (order_id, user_id))
+        cur.execute("DELETE FROM cart WHERE user_id=?", (user_id,))
+        _bump_product_sales(cur, order_id, 1)
+
+    return order_id, total
+
+
+def checkout(
+    user_id: int,
+    national_id: str,
+    full_name: str,
+    phone: str,
+    address: str,
+    description: str,
+    from_cart: bool = True,
+):
+    """
+    ثبت سفارش در یک تراکنش: ساخت سفارش، کپی آیتم‌های سبد در order_items
+    و خالی کردن سبد. اگر وسط کار خطا بدهد هیچ‌کدام ثبت نمی‌شود.
+    برمی‌گرداند: (order_id, total)
+    """
+    return run_write(
+        _checkout, user_id, national_id, full_name, phone, address, description, from_cart
+    )
+
+
+def _orders_page(
+    cur, where, params, before_id, after_id, limit,
+    from_sql="orders", id_col="orders.id",
+):
+    """
+    صفحه‌بندی keyset روی id سفارش‌ها (بدون OFFSET؛ هر صفحه یک range scan).
+    before_id: صفحه‌ی قدیمی‌تر از این id
+    after_id: صفحه‌ی جدیدتر از این id
+    برمی‌گرداند: (rows, has_older, has_newer) — ردیف‌ها همیشه جدیدترین اول
+    """
+    conds = list(where)
+    args = list(params)
+    if after_id is not None:
+        conds.append(f"{id_col} > ?")
+        args.append(after_id)
+        order = "ASC"
+    else:
+        if before_id is not None:
+            conds.append(f"{id_col} < ?")
+            args.append(before_id)
+        order = "DESC"
+
+    where_sql = ("WHERE " + " AND ".join(conds)) if conds else ""
+    cur.row_factory = OrderSummary.factory
+    cur.execute(f"""
+        SELECT
+            orders.id, orders.user_id, orders.full_name, orders.status,
+            orders.created_at, orders.total_amount, orders.item_count,
+            orders.created_ts
+        FROM {from_sql}
+        {where_sql}
+        ORDER BY {id_col} {order}
+        LIMIT ?
+    """, (*args, limit + 1))
+    rows = cur.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after_id is not None:
+        rows.reverse()
+        return rows, True, has_more
+    return rows, has_more, before_id is not None
+
+
+def list_orders_page(before_id: int = None, after_id: int = None, limit: int = 20):
+    with read_conn() as conn:
+        return _orders_page(conn.cursor(), [], [], before_id, after_id, limit)
+
+
+def list_orders_by_status(
+    status: str, before_id: int = None, after_id: int = None, limit: int = 20
+):
+    """یک صفحه از سفارش‌های یک وضعیت خاص (از ایندکس (status, id) استفاده می‌کند)."""
+    with read_conn() as conn:
+        return _orders_page(
+            conn.cursor(), ["status=?"], [status], before_id, after_id, limit
+        )
+
+
+def list_orders_between(
+    start_ts: int,
+    end_ts: int,
+    before_id: int = None,
+    after_id: int = None,
+    limit: int = 20,
+):
+    """
+    سفارش‌های ثبت‌شده در بازه‌ی [start_ts, end_ts) (epoch)، جدیدترین اول.
+    شرط زمانی با ایندکس idx_orders_created_ts به یک range scan تبدیل می‌شود.
+    """
+    with read_conn() as conn:
+        return _orders_page(
+            conn.cursor(),
+            ["orders.created_ts >= ?", "orders.created_ts < ?"],
+            [start_ts, end_ts],
+            before_id,
+            after_id,
+            limit,
+        )
+
+
+def _fts_query(text: str) -> str:
+    """
+    متن جستجوی ادمین را به یک عبارت MATCH امن تبدیل می‌کند:
+    هر کلمه به‌صورت prefix و همه‌ی کلمه‌ها با AND.
+    """
+    terms = []
+    for word in normalize_digits(text).split():
+        word = word.replace('"', "")
+        if word:
+            terms.append(f'"{word}"*')
+    return " ".join(terms)
+
+
+def search_orders(
+    text: str, before_id: int = None, after_id: int = None, limit: int = 20
+):
+    """جستجوی full-text روی نام، تلفن، کد ملی، آدرس و توضیحات (جدیدترین اول)."""
+    match = _fts_query(text)
+    if not match:
+        return [], False, False
+
+    with read_conn() as conn:
+        return _orders_page(
+            conn.cursor(),
+            ["orders_fts MATCH ?"],
+            [match],
+            before_id,
+            after_id,
+            limit,
+            from_sql="orders_fts JOIN orders ON orders.id = orders_fts.rowid",
+            id_col="orders_fts.rowid",
+        )
 
 
 def get_order(order_id: int):
-    with get_conn() as conn:
+    """سفارش را از جدول اصلی و اگر نبود از فایل بایگانی برمی‌گرداند."""
+    with read_conn() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT id, user_id, national_id, full_name, phone, address, description, status, created_at
-            FROM orders
-            WHERE id=?
-        """, (order_id,))
-        return cur.fetchone()
+        cur.row_factory = OrderDetail.factory
+        for schema in ("main", "archive"):
+            cur.execute(f"""
+                SELECT
+                    id, user_id, national_id, full_name, phone, address,
+                    description, status, created_at, created_ts
+                FROM {schema}.orders
+                WHERE id=?
+            """, (order_id,))
+            order = cur.fetchone()
+            if order:
+                return order
+        return None
 
 
-def update_order_status(order_id: int, new_status: str):
-    with get_conn() as conn:
+def get_order_detail(order_id: int):
+    """سفارش + آیتم‌ها + جمع کل با یک کوئری (LEFT JOIN روی order_items)."""
+    with read_conn() as conn:
         cur = conn.cursor()
-        cur.execute("UPDATE orders SET status=? WHERE id=?", (new_status, order_id))
-        conn.commit()
-        return cur.rowcount
+        for schema in ("main", "archive"):
+            cur.execute(f"""
+                SELECT
+                    o.id, o.user_id, o.national_id, o.full_name, o.phone,
+                    o.address, o.description, o.status, o.created_at, o.created_ts,
+                    i.product_title, i.quantity, i.price
+                FROM {schema}.orders o
+                LEFT JOIN {schema}.order_items i ON i.order_id = o.id
+                WHERE o.id=?
+                ORDER BY i.id ASC
+            """, (order_id,))
+            rows = cur.fetchall()
+            if rows:
+                break
+
+    if not rows:
+        return None
+
+    order = OrderDetail(*rows[0][:10])
+    order.items = [OrderItem(*r[10:]) for r in rows if r[10] is not None]
+    order.total = sum(item.line_total for item in order.items)
+    return order
+
+
+# کش متن رندرشده‌ی صفحه‌ی جزئیات سفارش: کلید (order_id, view)
+# اینجا تعریف شده تا update_order_status بتواند باطلش کند.
+order_text_cache = TTLCache(ORDER_TEXT_CACHE_SIZE, ORDER_TEXT_CACHE_TTL)
+ORDER_TEXT_VIEWS = ("admin", "user")
+
+
+def invalidate_order_text(order_id: int):
+    for view in ORDER_TEXT_VIEWS:
+        order_text_cache.pop((order_id, view))
+
+
+def _update_order_status(cur, order_id: int, new_status: str, changed_by: int = None):
+    cur.execute("""
+        SELECT status, created_ts, total_amount, item_count
+        FROM orders WHERE id=?
+    """, (order_id,))
+    row = cur.fetchone()
+    if row is None:
+        return 0
+
+    old_status, created_ts, total_amount, item_count = row
+    cur.execute("UPDATE orders SET status=? WHERE id=?", (new_status, order_id))
+    updated = cur.rowcount
+
+    # رویداد تاریخچه و جابه‌جایی بین ردیف‌های خلاصه‌ی روزانه در همان تراکنش
+    if old_status != new_status:
+        _add_status_event(cur, order_id, old_status, new_status, now_ts(), changed_by)
+        day = local_day(created_ts)
+        _bump_order_stats(cur, day, old_status, -1, -total_amount, -item_count)
+        _bump_order_stats(cur, day, new_status, 1, total_amount, item_count)
+        if new_status == "canceled":
+            _bump_product_sales(cur, order_id, -1)
+        elif old_status == "canceled":
+            _bump_product_sales(cur, order_id, 1)
+
+    return updated
+
+
+# بعد از commit متن کش‌شده‌ی سفارش باطل می‌شود (db._after_commit)
+_update_order_status.after_commit = lambda order_id, *_, **__: invalidate_order_text(order_id)
+
+
+def update_order_status(order_id: int, new_status: str, changed_by: int = None):
+    return run_write(_update_order_status, order_id, new_status, changed_by)
 
 
 # لیست آیتم‌های یک سفارش
 def get_order_items(order_id: int):
-    with get_conn() as conn:
+    with read_conn() as conn:
         cur = conn.cursor()
+        cur.row_factory = OrderItem.factory
         cur.execute("""
             SELECT product_title, quantity, price
             FROM order_items
@@ -126,131 +500,691 @@ def get_order_items(order_id: int):
 
 
 # ---------------- محصولات ----------------
+# محصولات خیلی کم تغییر می‌کنند ولی در هر لینک add_<code> و هر نمایش سبد
+# خوانده می‌شوند؛ برای همین جلوی جدول products یک کش LRU/TTL هست.
+
+_products_by_code = TTLCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL)
+_products_by_id = TTLCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL)
+
+
+# با هر invalidate_products یک واحد بالا می‌رود؛ خواننده‌ای که قبل از آن از
+# جدول خوانده، نتیجه‌اش را کش نمی‌کند
+_products_generation = 0
+_products_lock = threading.Lock()
+
+
+def _cache_product(product, generation: int):
+    with _products_lock:
+        if generation != _products_generation:
+            return
+        _products_by_code.set(product.code, product)
+        _products_by_id.set(product.id, product)
+
+
+def invalidate_products():
+    """بعد از هر تغییر در جدول products صدا زده شود."""
+    global _products_generation
+    with _products_lock:
+        _products_generation += 1
+        _products_by_code.clear()
+        _products_by_id.clear()
+
+
+def product_cache_stats() -> dict:
+    return {"by_code": _products_by_code.stats(), "by_id": _products_by_id.stats()}
+
+
+def _create_product(cur, code: str, title: str, price: int):
+    cur.execute("""
+    INSERT INTO products (code, title, price, is_active)
+    VALUES (?, ?, ?, 1)
+    """, (code, title, price))
+    return cur.lastrowid
+
+
+_create_product.after_commit = lambda *_, **__: invalidate_products()
+
 
 def create_product(code: str, title: str, price: int):
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-        INSERT INTO products (code, title, price, is_active)
-        VALUES (?, ?, ?, 1)
-        """, (code, title, price))
-        conn.commit()
-        return cur.lastrowid
+    return run_write(_create_product, code, title, price)
 
 
 def get_product_by_code(code: str):
-    with get_conn() as conn:
+    product = _products_by_code.get(code)
+    if product is not MISSING:
+        return product
+
+    generation = _products_generation
+    with read_conn() as conn:
         cur = conn.cursor()
+        cur.row_factory = Product.factory
         cur.execute("""
             SELECT id, code, title, price, is_active
             FROM products
             WHERE code=?
         """, (code,))
-        return cur.fetchone()
+        product = cur.fetchone()
+
+    if product:
+        _cache_product(product, generation)
+    return product
+
+
+def _get_products_by_ids(cur, product_ids):
+    """محصولات را اول از کش و بعد (فقط برای missها) با یک کوئری می‌خواند."""
+    found = {}
+    missing = []
+    for pid in set(product_ids):
+        product = _products_by_id.get(pid)
+        if product is MISSING:
+            missing.append(pid)
+        else:
+            found[pid] = product
+
+    if missing:
+        generation = _products_generation
+        placeholders = ",".join("?" * len(missing))
+        cur.row_factory = Product.factory
+        cur.execute(f"""
+            SELECT id, code, title, price, is_active
+            FROM products
+            WHERE id IN ({placeholders})
+        """, missing)
+        for product in cur.fetchall():
+            _cache_product(product, generation)
+            found[product.id] = product
+
+    return found
+
+
+def get_product_by_id(product_id: int):
+    with read_conn() as conn:
+        return _get_products_by_ids(conn.cursor(), [product_id]).get(product_id)
+
+
+_import_ids = itertools.count(1)
+
+
+def import_products(
+    rows, chunk_size: int = 1000, deactivate_missing: bool = True, keep_codes=()
+) -> dict:
+    """
+    درج/به‌روزرسانی دسته‌ای محصولات. rows یک iterable از
+    (code, title, price, is_active) است و تکه‌تکه (هر تکه یک تراکنش و یک
+    executemany) نوشته می‌شود تا قفل نویسنده طولانی نگه داشته نشود.
+    اگر deactivate_missing باشد، کدهایی که در فایل نبودند is_active=0 می‌شوند.
+    keep_codes: کدهای ردیف‌های ردشده‌ی فایل؛ بعد از تمام شدن rows خوانده
+    می‌شوند و غیرفعال نمی‌شوند (تعدادشان در kept).
+    """
+    stats = {"inserted": 0, "updated": 0, "deactivated": 0, "kept": 0}
+
+    # هر import جدول موقت خودش را دارد؛ همه‌ی importها روی همان اتصال نویسنده‌اند
+    staging = f"temp.import_codes_{next(_import_ids)}"
+    with write_conn() as conn:
+        conn.execute(
+            f"CREATE TABLE {staging} (code TEXT PRIMARY KEY, kept INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def flush(chunk):
+        codes = [row[0] for row in chunk]
+        with write_conn() as conn:
+            cur = conn.cursor()
+            ph = ",".join("?" * len(codes))
+            cur.execute(f"SELECT code FROM products WHERE code IN ({ph})", codes)
+            existing = {row[0] for row in cur.fetchall()}
+            cur.executemany("""
+                INSERT INTO products (code, title, price, is_active)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (code) DO UPDATE SET
+                    title = excluded.title,
+                    price = excluded.price,
+                    is_active = excluded.is_active
+            """, chunk)
+            cur.executemany(
+                f"INSERT OR IGNORE INTO {staging} (code) VALUES (?)",
+                [(code,) for code in codes],
+            )
+        for code in codes:
+            if code in existing:
+                stats["updated"] += 1
+            else:
+                stats["inserted"] += 1
+                existing.add(code)
+
+    try:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+
+        # فایلی که هیچ ردیف معتبری نداشت نباید کل کاتالوگ را غیرفعال کند
+        if deactivate_missing and (stats["inserted"] or stats["updated"]):
+            with write_conn() as conn:
+                cur = conn.cursor()
+                # محصولی که ردیفش در فایل بود ولی رد شد، به خاطر خطا غیرفعال نمی‌شود
+                cur.executemany(
+                    f"INSERT OR IGNORE INTO {staging} (code, kept) VALUES (?, 1)",
+                    [(code,) for code in keep_codes],
+                )
+                cur.execute(f"""
+                    SELECT COUNT(*) FROM products
+                    JOIN {staging} AS s USING (code)
+                    WHERE s.kept = 1 AND products.is_active = 1
+                """)
+                stats["kept"] = cur.fetchone()[0]
+                cur.execute(f"""
+                    UPDATE products SET is_active = 0
+                    WHERE is_active = 1
+                    AND code NOT IN (SELECT code FROM {staging})
+                """)
+                stats["deactivated"] = cur.rowcount
+    finally:
+        with write_conn() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {staging}")
+        invalidate_products()
+
+    return stats
 
 
 # ---------------- سبد خرید ----------------
 
+def _add_to_cart(cur, user_id: int, product_id: int):
+    cur.execute("""
+        INSERT INTO cart (user_id, product_id, quantity)
+        VALUES (?, ?, 1)
+        ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = quantity + 1
+    """, (user_id, product_id))
+
+
 def add_to_cart(user_id: int, product_id: int):
     """اگر این محصول در سبد بود، تعدادش +۱ می‌شود؛ اگر نبود، ردیف جدید ساخته می‌شود."""
-    with get_conn() as conn:
-        cur = conn.cursor()
+    return run_write(_add_to_cart, user_id, product_id)
 
+
+def get_cart(user_id: int):
+    """برمی‌گرداند لیست CartLine (cart_id, product_id, quantity, title, price)"""
+    with read_conn() as conn:
+        cur = conn.cursor()
         cur.execute("""
-            SELECT id, quantity
+            SELECT id, product_id, quantity
             FROM cart
-            WHERE user_id=? AND product_id=?
-        """, (user_id, product_id))
-        row = cur.fetchone()
-
-        if row:
-            cart_id, qty = row
-            new_qty = qty + 1
-            cur.execute("UPDATE cart SET quantity=? WHERE id=?", (new_qty, cart_id))
-        else:
-            cur.execute("""
-                INSERT INTO cart (user_id, product_id, quantity)
-                VALUES (?, ?, 1)
-            """, (user_id, product_id))
+            WHERE user_id=?
+            ORDER BY id ASC
+        """, (user_id,))
+        rows = cur.fetchall()
+        if not rows:
+            return []
+        products = _get_products_by_ids(cur, [product_id for _, product_id, _ in rows])
 
-        conn.commit()
+    items = []
+    for cart_id, product_id, qty in rows:
+        product = products.get(product_id)
+        if product:
+            items.append(CartLine(cart_id, product_id, qty, product.title, product.price))
+    return items
 
 
-def get_cart(user_id: int):
+def _change_cart_quantity(cur, user_id: int, cart_id: int, delta: int):
+    cur.execute("""
+        UPDATE cart SET quantity = quantity + ?
+        WHERE id=? AND user_id=?
+        RETURNING quantity
+    """, (delta, cart_id, user_id))
+    row = cur.fetchone()
+    if row is None:
+        return None
+
+    if row[0] <= 0:
+        cur.execute("DELETE FROM cart WHERE id=?", (cart_id,))
+        return 0
+    return row[0]
+
+
+def change_cart_quantity(user_id: int, cart_id: int, delta: int):
     """
-    برمی‌گرداند لیست:
-    (cart_id, product_id, quantity, title, price)
+    تعداد یک آیتم سبد را delta تا تغییر می‌دهد؛ اگر به صفر برسد ردیف حذف می‌شود.
+    برمی‌گرداند: تعداد جدید (۰ یعنی حذف شد) یا None اگر این آیتم مال این کاربر نبود.
     """
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT
-                c.id,
-                c.product_id,
-                c.quantity,
-                p.title,
-                p.price
-            FROM cart c
-            JOIN products p ON c.product_id = p.id
-            WHERE c.user_id=?
-            ORDER BY c.id ASC
-        """, (user_id,))
-        return cur.fetchall()
+    return run_write(_change_cart_quantity, user_id, cart_id, delta)
 
 
-def update_cart_item_quantity(cart_id: int, new_quantity: int):
-    with get_conn() as conn:
-        cur = conn.cursor()
-        if new_quantity <= 0:
-            cur.execute("DELETE FROM cart WHERE id=?", (cart_id,))
-        else:
-            cur.execute("UPDATE cart SET quantity=? WHERE id=?", (new_quantity, cart_id))
-        conn.commit()
+def _remove_cart_item(cur, user_id: int, cart_id: int) -> bool:
+    cur.execute(
+        "DELETE FROM cart WHERE id=? AND user_id=? RETURNING id", (cart_id, user_id)
+    )
+    return cur.fetchone() is not None
 
 
-def remove_cart_item(cart_id: int):
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM cart WHERE id=?", (cart_id,))
-        conn.commit()
+def remove_cart_item(user_id: int, cart_id: int) -> bool:
+    return run_write(_remove_cart_item, user_id, cart_id)
+
+
+def _clear_cart(cur, user_id: int):
+    cur.execute("DELETE FROM cart WHERE user_id=?", (user_id,))
 
 
 def clear_cart(user_id: int):
-    with get_conn() as conn:
+    return run_write(_clear_cart, user_id)
+
+
+def list_orders_by_user_page(
+    user_id: int, before_id: int = None, after_id: int = None, limit: int = 10
+):
+    """یک صفحه از سفارش‌های یک کاربر خاص (جدیدترین اول)."""
+    with read_conn() as conn:
+        return _orders_page(
+            conn.cursor(), ["user_id=?"], [user_id], before_id, after_id, limit
+        )
+
+
+def user_has_orders(user_id: int) -> bool:
+    with read_conn() as conn:
         cur = conn.cursor()
-        cur.execute("DELETE FROM cart WHERE user_id=?", (user_id,))
-        conn.commit()
+        cur.execute("SELECT EXISTS (SELECT 1 FROM orders WHERE user_id=?)", (user_id,))
+        return bool(cur.fetchone()[0])
+
+
+# ---------------- بایگانی ----------------
+# سفارش‌های تمام‌شده‌ی قدیمی به archive.orders / archive.order_items منتقل
+# می‌شوند تا جدول اصلی (و ایندکس‌هایش) کوچک بماند. اسکیمای بایگانی از روی
+# جدول اصلی ساخته می‌شود و با اضافه شدن ستون جدید به‌روز می‌شود.
 
+# (جدول، ستون id سفارش)
+_ARCHIVED_TABLES = (
+    ("orders", "id"),
+    ("order_items", "order_id"),
+    ("order_status_events", "order_id"),
+)
+_ARCHIVE_STATUSES = ("done", "canceled")
 
-# ذخیره‌ی آیتم‌های سبد خرید در جدول order_items
-def save_cart_to_order(order_id: int, user_id: int):
+
+def _table_columns(conn, schema: str, table: str):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _sync_archive_schema(conn):
+    for table, _ in _ARCHIVED_TABLES:
+        main_cols = _table_columns(conn, "main", table)
+        archive_cols = _table_columns(conn, "archive", table)
+        if not archive_cols:
+            conn.execute(
+                f"CREATE TABLE archive.{table} AS SELECT * FROM main.{table} WHERE 0"
+            )
+        else:
+            for col in main_cols:
+                if col not in archive_cols:
+                    conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {col}")
+
+    # سفارش‌هایی که قبل از مهاجرت ۷ بایگانی شده‌اند created_ts ندارند
+    conn.execute("""
+        UPDATE archive.orders
+        SET created_ts = CAST(strftime('%s', created_at) AS INTEGER)
+        WHERE created_ts IS NULL
+    """)
+
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS archive.ux_orders_id ON orders (id)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS archive.ux_order_items_id ON order_items (id)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS archive.idx_order_items_order_id ON order_items (order_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS archive.idx_orders_created_ts ON orders (created_ts)"
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS archive.ux_status_events_id ON order_status_events (id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS archive.idx_status_events_order "
+        "ON order_status_events (order_id, id)"
+    )
+
+
+def archive_orders(older_than_days: int, batch_size: int = 500) -> int:
     """
-    آیتم‌های سبد خرید این کاربر را می‌خواند
-    و برای این سفارش، در order_items ذخیره می‌کند.
+    سفارش‌های done/canceled قدیمی‌تر از older_than_days روز را همراه آیتم‌ها و تاریخچه‌ی وضعیتشان
+    دسته‌به‌دسته (هر دسته یک تراکنش) به فایل بایگانی منتقل می‌کند.
+    برمی‌گرداند: تعداد سفارش‌های منتقل‌شده
+
+    در حالت WAL تراکنش روی دو فایل برای هر فایل جداگانه اتمیک است؛ برای همین
+    اول کپی (INSERT OR IGNORE) و بعد حذف انجام می‌شود تا در بدترین حالت فقط
+    یک دسته دوباره کپی شود و هیچ سفارشی گم نشود.
     """
-    cart_items = get_cart(user_id)
-    if not cart_items:
-        return
+    cutoff = now_ts() - older_than_days * 86400
+    placeholders_status = ",".join("?" * len(_ARCHIVE_STATUSES))
+    moved = 0
+
+    while True:
+        with write_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT id FROM main.orders
+                WHERE status IN ({placeholders_status}) AND created_ts < ?
+                ORDER BY id ASC
+                LIMIT ?
+            """, (*_ARCHIVE_STATUSES, cutoff, batch_size))
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                break
 
-    with get_conn() as conn:
+            ph = ",".join("?" * len(ids))
+            for table, key in _ARCHIVED_TABLES:
+                cols = ", ".join(_table_columns(conn, "main", table))
+                cur.execute(f"""
+                    INSERT OR IGNORE INTO archive.{table} ({cols})
+                    SELECT {cols} FROM main.{table} WHERE {key} IN ({ph})
+                """, ids)
+            for table, key in reversed(_ARCHIVED_TABLES):
+                cur.execute(f"DELETE FROM main.{table} WHERE {key} IN ({ph})", ids)
+
+        moved += len(ids)
+        if len(ids) < batch_size:
+            break
+
+    return moved
+
+
+# ---------------- خروجی سفارش‌ها ----------------
+
+EXPORT_COLUMNS = (
+    "id",
+    "user_id",
+    "full_name",
+    "national_id",
+    "phone",
+    "address",
+    "description",
+    "status",
+    "created_at",
+    "total_amount",
+    "item_count",
+    "created_ts",
+)
+
+
+def _export_where(status: str = None, date_from: date = None, date_to: date = None):
+    """
+    شرط‌های فیلتر خروجی. تاریخ‌ها (date) روز به وقت تهران هستند و date_to
+    شامل خود آن روز هم می‌شود.
+    """
+    conds, args = [], []
+    if status:
+        conds.append("status = ?")
+        args.append(status)
+    if date_from:
+        conds.append("created_ts >= ?")
+        args.append(day_range(date_from)[0])
+    if date_to:
+        conds.append("created_ts < ?")
+        args.append(day_range(date_to)[1])
+    return conds, args
+
+
+def count_orders_for_export(
+    status: str = None, date_from: date = None, date_to: date = None
+) -> int:
+    """تعداد سفارش‌های خروجی (اصلی + بایگانی) برای نمایش پیشرفت."""
+    conds, args = _export_where(status, date_from, date_to)
+    where_sql = ("WHERE " + " AND ".join(conds)) if conds else ""
+    with read_conn() as conn:
+        total = 0
+        for schema in ("archive", "main"):
+            row = conn.execute(
+                f"SELECT COUNT(*) FROM {schema}.orders {where_sql}", args
+            ).fetchone()
+            total += row[0]
+        return total
+
+
+def export_orders_chunk(
+    schema: str,
+    after_id: int = None,
+    limit: int = 500,
+    status: str = None,
+    date_from: date = None,
+    date_to: date = None,
+):
+    """
+    یک تکه از سفارش‌ها برای خروجی، به ترتیب id صعودی و بعد از after_id.
+    هر تکه اتصال خواننده را فقط برای همان کوئری می‌گیرد، پس خروجی بزرگ
+    جلوی بقیه‌ی کوئری‌ها را نمی‌گیرد و حافظه فقط به اندازه‌ی یک تکه است.
+    schema: «main» یا «archive»
+    """
+    if schema not in ("main", "archive"):
+        raise ValueError(schema)
+
+    conds, args = _export_where(status, date_from, date_to)
+    if after_id is not None:
+        conds.append("id > ?")
+        args.append(after_id)
+    where_sql = ("WHERE " + " AND ".join(conds)) if conds else ""
+
+    with read_conn() as conn:
+        cur = conn.execute(f"""
+            SELECT {", ".join(EXPORT_COLUMNS)}
+            FROM {schema}.orders
+            {where_sql}
+            ORDER BY id ASC
+            LIMIT ?
+        """, (*args, limit))
+        return cur.fetchall()
+
+
+# ---------------- آمار فروش ----------------
+# جدول‌های daily_order_stats و daily_product_sales (مهاجرت ۶) در همان
+# تراکنش ثبت سفارش / تغییر وضعیت به‌روز می‌شوند؛ گزارش‌ها فقط روی این
+# جدول‌ها (یک ردیف برای هر روز) اجرا می‌شوند، نه روی orders.
+# روزها از مهاجرت ۷ به وقت تهران هستند (تابع SQL local_day).
+
+def _bump_order_stats(cur, day: str, status: str, orders: int, revenue: int, items: int):
+    cur.execute("""
+        INSERT INTO daily_order_stats (day, status, orders, revenue, items)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (day, status) DO UPDATE SET
+            orders = orders + excluded.orders,
+            revenue = revenue + excluded.revenue,
+            items = items + excluded.items
+    """, (day, status, orders, revenue, items))
+
+
+def _bump_product_sales(cur, order_id: int, sign: int):
+    """اقلام یک سفارش را به فروش روزانه‌ی محصولات اضافه (sign=1) یا از آن کم (sign=-1) می‌کند."""
+    cur.execute("""
+        INSERT INTO daily_product_sales (day, product_title, quantity, revenue)
+        SELECT local_day(o.created_ts), i.product_title,
+               ? * SUM(i.quantity), ? * SUM(i.quantity * i.price)
+        FROM order_items i
+        JOIN orders o ON o.id = i.order_id
+        WHERE i.order_id = ?
+        GROUP BY i.product_title
+        ON CONFLICT (day, product_title) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue
+    """, (sign, sign, order_id))
+
+
+def sales_summary(days: int, top_products: int = 5) -> dict:
+    """
+    خلاصه‌ی فروش days روز اخیر (شامل امروز).
+    برمی‌گرداند: {"by_status": {status: (orders, revenue, items)}, "top_products": [(title, quantity, revenue)]}
+    """
+    since = (local_today() - timedelta(days=days - 1)).isoformat()
+    with read_conn() as conn:
         cur = conn.cursor()
-        for cart_id, product_id, qty, title, price in cart_items:
-            cur.execute("""
-                INSERT INTO order_items (order_id, product_title, quantity, price)
-                VALUES (?, ?, ?, ?)
-            """, (order_id, title, qty, price))
-        conn.commit()
+        cur.execute("""
+            SELECT status, SUM(orders), SUM(revenue), SUM(items)
+            FROM daily_order_stats
+            WHERE day >= ?
+            GROUP BY status
+            HAVING SUM(orders) > 0
+        """, (since,))
+        by_status = {status: (n, revenue, items) for status, n, revenue, items in cur}
+
+        cur.execute("""
+            SELECT product_title, SUM(quantity) AS qty, SUM(revenue)
+            FROM daily_product_sales
+            WHERE day >= ?
+            GROUP BY product_title
+            HAVING qty > 0
+            ORDER BY qty DESC
+            LIMIT ?
+        """, (since, top_products))
+        return {"by_status": by_status, "top_products": cur.fetchall()}
+
+
+# ---------------- تاریخچه‌ی وضعیت ----------------
+# order_status_events (مهاجرت ۸) فقط اضافه می‌شود و هیچ‌وقت ویرایش نمی‌شود.
+# مدت ماندن در هر وضعیت = فاصله‌ی هر رویداد تا رویداد قبلی همان سفارش؛
+# گزارش‌ها فقط روی این جدول و ایندکس‌هایش اجرا می‌شوند، نه روی orders.
+
+def _add_status_event(cur, order_id, old_status, new_status, changed_at, changed_by=None):
+    cur.execute("""
+        INSERT INTO order_status_events (order_id, old_status, new_status, changed_at, changed_by)
+        VALUES (?, ?, ?, ?, ?)
+    """, (order_id, old_status, new_status, changed_at, changed_by))
+
+
+def get_order_timeline(order_id: int):
+    """رویدادهای وضعیت یک سفارش به ترتیب زمان (از جدول اصلی یا بایگانی)."""
+    with read_conn() as conn:
+        cur = conn.cursor()
+        cur.row_factory = StatusEvent.factory
+        for schema in ("main", "archive"):
+            cur.execute(f"""
+                SELECT old_status, new_status, changed_at, changed_by
+                FROM {schema}.order_status_events
+                WHERE order_id=?
+                ORDER BY id ASC
+            """, (order_id,))
+            events = cur.fetchall()
+            if events:
+                return events
+        return []
+
 
+def status_durations(since_ts: int) -> dict:
+    """
+    معیارهای SLA برای رویدادهای بعد از since_ts:
+    - by_status: {status: (count, avg_seconds, max_seconds)} مدت ماندن در هر وضعیت
+      تا خروج از آن (فقط بازه‌های بسته‌شده)
+    - fulfilment: (count, avg_seconds, max_seconds) از ثبت سفارش تا done
 
-def list_orders_by_user(user_id: int, limit: int = 10, offset: int = 0):
-    """لیست سفارش‌های یک کاربر خاص را برمی‌گرداند."""
-    with get_conn() as conn:
+    رویداد قبلی هر رویداد با ایندکس (order_id, id) پیدا می‌شود، پس هزینه به
+    تعداد رویدادهای بازه بستگی دارد. سفارش‌های بایگانی‌شده حساب نمی‌شوند.
+    """
+    with read_conn() as conn:
         cur = conn.cursor()
         cur.execute("""
-            SELECT id, user_id, national_id, full_name, phone, address, description, status, created_at
-            FROM orders
-            WHERE user_id=?
-            ORDER BY id DESC
-            LIMIT ? OFFSET ?
-        """, (user_id, limit, offset))
-        return cur.fetchall()
\ No newline at end of file
+            SELECT e.old_status, COUNT(*),
+                   AVG(e.changed_at - p.changed_at), MAX(e.changed_at - p.changed_at)
+            FROM order_status_events e
+            JOIN order_status_events p ON p.id = (
+                SELECT MAX(id) FROM order_status_events
+                WHERE order_id = e.order_id AND id < e.id
+            )
+            WHERE e.changed_at >= ? AND e.old_status IS NOT NULL
+            GROUP BY e.old_status
+        """, (since_ts,))
+        by_status = {
+            status: (n, int(avg), int(longest)) for status, n, avg, longest in cur
+        }
+
+        cur.execute("""
+            SELECT COUNT(*),
+                   AVG(e.changed_at - f.changed_at), MAX(e.changed_at - f.changed_at)
+            FROM order_status_events e
+            JOIN order_status_events f ON f.id = (
+                SELECT MIN(id) FROM order_status_events WHERE order_id = e.order_id
+            )
+            WHERE e.changed_at >= ? AND e.new_status = 'done'
+        """, (since_ts,))
+        n, avg, longest = cur.fetchone()
+        fulfilment = (n, int(avg or 0), int(longest or 0))
+
+        return {"by_status": by_status, "fulfilment": fulfilment}
+
+
+# ---------------- وضعیت گفتگوها ----------------
+# user_data و مرحله‌ی ConversationHandler ها برای services/persistence.py
+
+def load_user_data():
+    """(user_id, data) همه‌ی کاربرها؛ data همان bytes ذخیره‌شده (pickle) است."""
+    with read_conn() as conn:
+        return conn.execute("SELECT user_id, data FROM bot_user_data").fetchall()
+
+
+def load_conversations(name: str):
+    """(key, state) گفتگوهای باز یک ConversationHandler، هر دو به‌صورت JSON."""
+    with read_conn() as conn:
+        return conn.execute(
+            "SELECT key, state FROM bot_conversations WHERE name = ?", (name,)
+        ).fetchall()
+
+
+def _save_bot_state(cur, user_data: dict, conversations: dict, updated_at: int):
+    """
+    user_data: {user_id: bytes یا None برای حذف}
+    conversations: {(name, key): state یا None برای پایان گفتگو}؛ key و state به‌صورت JSON
+    """
+    cur.executemany(
+        """
+        INSERT INTO bot_user_data (user_id, data, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+        """,
+        [(uid, data, updated_at) for uid, data in user_data.items() if data is not None],
+    )
+    cur.executemany(
+        "DELETE FROM bot_user_data WHERE user_id = ?",
+        [(uid,) for uid, data in user_data.items() if data is None],
+    )
+    cur.executemany(
+        """
+        INSERT INTO bot_conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(name, key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+        """,
+        [
+            (name, key, state, updated_at)
+            for (name, key), state in conversations.items()
+            if state is not None
+        ],
+    )
+    cur.executemany(
+        "DELETE FROM bot_conversations WHERE name = ? AND key = ?",
+        [key for key, state in conversations.items() if state is None],
+    )
+
+
+def save_bot_state(user_data: dict, conversations: dict, updated_at: int):
+    return run_write(_save_bot_state, user_data, conversations, updated_at)
+
+
+def _prune_bot_state(cur, before_ts: int) -> int:
+    cur.execute("DELETE FROM bot_user_data WHERE updated_at < ?", (before_ts,))
+    removed = cur.rowcount
+    cur.execute("DELETE FROM bot_conversations WHERE updated_at < ?", (before_ts,))
+    return removed + cur.rowcount
+
+
+def prune_bot_state(before_ts: int) -> int:
+    """گفتگوها و user_data ای که از before_ts به بعد دست نخورده‌اند پاک می‌شوند."""
+    return run_write(_prune_bot_state, before_ts)
+
+
+# ---------------- صف نوشتن ----------------
+# عملیات‌هایی که db_async می‌تواند به‌جای تراکنش جدا، از طریق صف group commit
+# (services/write_queue.py) بفرستد. هر مقدار op(cur, ...) است و تابع عمومی هم‌نام
+# همان op را با run_write اجرا می‌کند.
+WRITE_OPS = {
+    "create_order": _insert_order,
+    "checkout": _checkout,
+    "update_order_status": _update_order_status,
+    "create_product": _create_product,
+    "add_to_cart": _add_to_cart,
+    "change_cart_quantity": _change_cart_quantity,
+    "remove_cart_item": _remove_cart_item,
+    "clear_cart": _clear_cart,
+    "save_bot_state": _save_bot_state,
+}
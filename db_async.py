@@ -0,0 +1,95 @@
+# db_async.py
+"""
+نسخه‌ی awaitable توابع دیتابیس برای استفاده در هندلرهای async.
+
+هر تابع روی یک ThreadPoolExecutor اختصاصی و محدود اجرا می‌شود تا
+کوئری‌های کند یا قفل دیتابیس، event loop ربات را متوقف نکنند.
+نوشتن‌های سبد و سفارش روی SQLite از صف group commit (write_queue) می‌گذرند.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from config import DB_WORKERS, WRITE_BATCH_MAX, WRITE_BATCH_LATENCY_MS
+from services.orders_service import get_storage, SqliteStorage
+from services.write_queue import WriteQueue
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(func, *args, **kwargs):
+    """اجرای یک تابع همگام دیتابیس روی executor مخصوص دیتابیس."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+
+    return wrapper
+
+
+# در bot.py هنگام شروع start و هنگام توقف stop می‌شود
+write_queue = WriteQueue(run_db, WRITE_BATCH_MAX, WRITE_BATCH_LATENCY_MS / 1000)
+
+
+def _write(name):
+    """مثل _wrap، ولی روی SQLite عملیات db.WRITE_OPS[name] را به صف نوشتن می‌دهد."""
+    method = getattr(_storage, name)
+    if not isinstance(_storage, SqliteStorage) or WRITE_BATCH_MAX <= 1:
+        return _wrap(method)
+
+    op = db.WRITE_OPS[name]
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        return await write_queue.submit(op, *args, **kwargs)
+
+    return wrapper
+
+
+def shutdown():
+    """صبر می‌کند تا کوئری‌های در حال اجرا تمام شوند و تردها بسته شوند."""
+    _executor.shutdown(wait=True)
+
+
+# توابع زیر از storage انتخاب‌شده در config می‌آیند (services/orders_service.py)
+_storage = get_storage()
+
+# ---------------- سفارش‌ها ----------------
+create_order = _write("create_order")
+checkout = _write("checkout")
+list_orders_page = _wrap(_storage.list_orders_page)
+list_orders_by_status = _wrap(_storage.list_orders_by_status)
+list_orders_between = _wrap(_storage.list_orders_between)
+search_orders = _wrap(_storage.search_orders)
+get_order = _wrap(_storage.get_order)
+get_order_detail = _wrap(_storage.get_order_detail)
+update_order_status = _write("update_order_status")
+get_order_items = _wrap(_storage.get_order_items)
+list_orders_by_user_page = _wrap(_storage.list_orders_by_user_page)
+user_has_orders = _wrap(_storage.user_has_orders)
+
+# ---------------- محصولات ----------------
+create_product = _write("create_product")
+get_product_by_code = _wrap(_storage.get_product_by_code)
+get_product_by_id = _wrap(_storage.get_product_by_id)
+
+# ---------------- سبد خرید ----------------
+add_to_cart = _write("add_to_cart")
+get_cart = _wrap(_storage.get_cart)
+change_cart_quantity = _write("change_cart_quantity")
+remove_cart_item = _write("remove_cart_item")
+clear_cart = _write("clear_cart")
+
+# ---------------- گزارش‌ها ----------------
+count_orders_for_export = _wrap(_storage.count_orders_for_export)
+export_orders_chunk = _wrap(_storage.export_orders_chunk)
+sales_summary = _wrap(_storage.sales_summary)
+get_order_timeline = _wrap(_storage.get_order_timeline)
+status_durations = _wrap(_storage.status_durations)
@@ -1,58 +1,132 @@
 # handlers/admin.py
+import os
+import tempfile
+
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
 )
-from telegram.ext import ContextTypes
+from telegram.ext import ContextTypes, ConversationHandler
 
-from db import (
-    list_orders,
+from db_async import (
+    list_orders_page,
+    list_orders_by_status,
+    list_orders_between,
+    search_orders,
     get_order,
-    get_order_items,
     update_order_status,
+    count_orders_for_export,
+    sales_summary,
+    get_order_timeline,
+    status_durations,
+)
+from utils.validators import is_admin, normalize_digits
+from utils.constants import STATUS_LABELS, ADMIN_ORDERS_PAGE_SIZE, SEARCH_QUERY
+from keyboards.main_keyboards import pager_row
+from utils.texts import order_detail_text
+from services.orders_export import parse_export_args, export_orders
+from services.update_processor import PerUserUpdateProcessor
+from utils.timeutils import (
+    format_ts,
+    format_duration,
+    now_ts,
+    local_today,
+    day_range,
+    parse_day,
 )
-from utils.validators import is_admin
-from utils.constants import STATUS_LABELS
 
 
-async def send_latest_orders_list(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
-    orders = list_orders(limit=20, offset=0)
+# عنوان هر لیست صفحه‌بندی‌شده (scope داخل callback_data می‌آید)
+LIST_TITLES = {
+    "all": "📚 لیست همه سفارش‌ها (جدیدترین در بالا):\n",
+    "new": "⏳ سفارشات تعیین وضعیت نشده:\n",
+    "search": "🔎 نتایج جستجو:\n",
+    "today": "📅 سفارش‌های امروز:\n",
+    "range": "📅 سفارش‌های بازه‌ی انتخاب‌شده:\n",
+}
 
-    if not orders:
-        await context.bot.send_message(
-            chat_id=chat_id, text="هنوز هیچ سفارشی ثبت نشده 💤"
+
+async def _fetch_orders_page(
+    context: ContextTypes.DEFAULT_TYPE,
+    scope: str,
+    before_id: int = None,
+    after_id: int = None,
+):
+    if scope == "search":
+        # متن جستجو در callback_data جا نمی‌شود؛ در user_data نگه داشته می‌شود
+        return await search_orders(
+            context.user_data.get("search_query", ""),
+            before_id=before_id,
+            after_id=after_id,
+            limit=ADMIN_ORDERS_PAGE_SIZE,
         )
-        return
+    if scope in ("today", "range"):
+        if scope == "today":
+            start_ts, end_ts = day_range(local_today())
+        else:
+            # بازه‌ی /orders_between هم مثل متن جستجو در user_data می‌ماند
+            start_ts, end_ts = context.user_data.get("orders_range", (0, 0))
+        return await list_orders_between(
+            start_ts,
+            end_ts,
+            before_id=before_id,
+            after_id=after_id,
+            limit=ADMIN_ORDERS_PAGE_SIZE,
+        )
+    if scope == "new":
+        return await list_orders_by_status(
+            "new", before_id=before_id, after_id=after_id, limit=ADMIN_ORDERS_PAGE_SIZE
+        )
+    return await list_orders_page(
+        before_id=before_id, after_id=after_id, limit=ADMIN_ORDERS_PAGE_SIZE
+    )
+
 
-    lines = ["📋 آخرین سفارش‌ها:\n"]
+def _orders_list_view(title: str, rows, has_older: bool, has_newer: bool, scope: str):
+    """متن و کیبورد یک صفحه از لیست سفارش‌ها (با دکمه‌های صفحه‌بندی)."""
+    lines = [title]
     kb_rows = []
 
-    for row in orders:
-        (
-            order_id,
-            u_id,
-            national_id,
-            full_name,
-            phone,
-            address,
-            desc,
-            status,
-            created_at,
-        ) = row
-        status_label = STATUS_LABELS.get(status, status)
-        lines.append(f"#{order_id} | {full_name} | {status_label}")
+    for o in rows:
+        if scope == "new":
+            info = format_ts(o.created_ts)
+        elif scope in ("today", "range"):
+            info = f"{STATUS_LABELS.get(o.status, o.status)} | {format_ts(o.created_ts)}"
+        else:
+            info = STATUS_LABELS.get(o.status, o.status)
+        line = f"#{o.id} | {o.full_name} | {info}"
+        if o.item_count:
+            line += f" | {o.total_amount} تومان"
+        lines.append(line)
         kb_rows.append(
             [
                 InlineKeyboardButton(
-                    f"مشاهده #{order_id}",
-                    callback_data=f"view_order:{order_id}",
+                    f"مشاهده #{o.id}",
+                    callback_data=f"view_order:{o.id}",
                 )
             ]
         )
 
-    text = "\n".join(lines)
-    keyboard = InlineKeyboardMarkup(kb_rows)
+    nav = pager_row(f"orders_page:{scope}", rows, has_older, has_newer)
+    if nav:
+        kb_rows.append(nav)
+
+    return "\n".join(lines), InlineKeyboardMarkup(kb_rows)
+
+
+async def send_latest_orders_list(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+    orders, _, _ = await _fetch_orders_page(context, "all")
+
+    if not orders:
+        await context.bot.send_message(
+            chat_id=chat_id, text="هنوز هیچ سفارشی ثبت نشده 💤"
+        )
+        return
+
+    text, keyboard = _orders_list_view(
+        "📋 آخرین سفارش‌ها:\n", orders, False, False, "all"
+    )
 
     await context.bot.send_message(
         chat_id=chat_id,
@@ -62,7 +136,7 @@ async def send_latest_orders_list(chat_id: int, context: ContextTypes.DEFAULT_TY
 
 
 async def send_all_orders_list(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
-    orders = list_orders(limit=1000, offset=0)
+    orders, has_older, has_newer = await _fetch_orders_page(context, "all")
 
     if not orders:
         await context.bot.send_message(
@@ -70,34 +144,9 @@ async def send_all_orders_list(chat_id: int, context: ContextTypes.DEFAULT_TYPE)
         )
         return
 
-    lines = ["📚 لیست همه سفارش‌ها (جدیدترین در بالا):\n"]
-    kb_rows = []
-
-    for row in orders:
-        (
-            order_id,
-            u_id,
-            national_id,
-            full_name,
-            phone,
-            address,
-            desc,
-            status,
-            created_at,
-        ) = row
-        status_label = STATUS_LABELS.get(status, status)
-        lines.append(f"#{order_id} | {full_name} | {status_label}")
-        kb_rows.append(
-            [
-                InlineKeyboardButton(
-                    f"مشاهده #{order_id}",
-                    callback_data=f"view_order:{order_id}",
-                )
-            ]
-        )
-
-    text = "\n".join(lines)
-    keyboard = InlineKeyboardMarkup(kb_rows)
+    text, keyboard = _orders_list_view(
+        LIST_TITLES["all"], orders, has_older, has_newer, "all"
+    )
 
     await context.bot.send_message(
         chat_id=chat_id,
@@ -109,43 +158,36 @@ async def send_all_orders_list(chat_id: int, context: ContextTypes.DEFAULT_TYPE)
 async def send_unreviewed_orders_list(
     chat_id: int, context: ContextTypes.DEFAULT_TYPE
 ):
-    orders = list_orders(limit=1000, offset=0)
-    pending_orders = [row for row in orders if row[7] == "new"]
+    orders, has_older, has_newer = await _fetch_orders_page(context, "new")
 
-    if not pending_orders:
+    if not orders:
         await context.bot.send_message(
             chat_id=chat_id,
             text="همه‌ی سفارش‌ها وضعیت دارند ✅\nسفارشی بدون وضعیت (new) پیدا نشد.",
         )
         return
 
-    lines = ["⏳ سفارشات تعیین وضعیت نشده:\n"]
-    kb_rows = []
+    text, keyboard = _orders_list_view(
+        LIST_TITLES["new"], orders, has_older, has_newer, "new"
+    )
+
+    await context.bot.send_message(
+        chat_id=chat_id,
+        text=text,
+        reply_markup=keyboard,
+    )
 
-    for row in pending_orders:
-        (
-            order_id,
-            u_id,
-            national_id,
-            full_name,
-            phone,
-            address,
-            desc,
-            status,
-            created_at,
-        ) = row
-        lines.append(f"#{order_id} | {full_name} | {created_at[:19]}")
-        kb_rows.append(
-            [
-                InlineKeyboardButton(
-                    f"مشاهده #{order_id}",
-                    callback_data=f"view_order:{order_id}",
-                )
-            ]
-        )
 
-    text = "\n".join(lines)
-    keyboard = InlineKeyboardMarkup(kb_rows)
+async def send_today_orders_list(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+    orders, has_older, has_newer = await _fetch_orders_page(context, "today")
+
+    if not orders:
+        await context.bot.send_message(chat_id=chat_id, text="امروز هنوز سفارشی ثبت نشده 💤")
+        return
+
+    text, keyboard = _orders_list_view(
+        LIST_TITLES["today"], orders, has_older, has_newer, "today"
+    )
 
     await context.bot.send_message(
         chat_id=chat_id,
@@ -154,6 +196,251 @@ async def send_unreviewed_orders_list(
     )
 
 
+async def today_orders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("شما ادمین نیستید ❌")
+        return
+
+    await send_today_orders_list(update.effective_chat.id, context)
+
+
+async def orders_between_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/orders_between 2024-01-01 [2024-01-31] — روزها به وقت تهران، روز آخر هم حساب است."""
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("شما ادمین نیستید ❌")
+        return
+
+    args = context.args or []
+    if not 1 <= len(args) <= 2:
+        await update.message.reply_text(
+            "استفاده: /orders_between YYYY-MM-DD [YYYY-MM-DD]\n"
+            "مثال: /orders_between 2024-01-01 2024-01-31"
+        )
+        return
+
+    try:
+        days = [parse_day(arg) for arg in args]
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+
+    first, last = min(days), max(days)
+    context.user_data["orders_range"] = day_range(first, last)
+
+    orders, has_older, has_newer = await _fetch_orders_page(context, "range")
+    if not orders:
+        await update.message.reply_text("در این بازه سفارشی ثبت نشده 💤")
+        return
+
+    title = f"📅 سفارش‌های {first.isoformat()} تا {last.isoformat()}:\n"
+    text, keyboard = _orders_list_view(title, orders, has_older, has_newer, "range")
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+
+async def admin_orders_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """دکمه‌های «جدیدتر/قدیمی‌تر» لیست سفارش‌های ادمین."""
+    query = update.callback_query
+    await query.answer()
+
+    user_id = query.from_user.id
+    if not is_admin(user_id):
+        await query.edit_message_text("شما ادمین نیستید ❌")
+        return
+
+    try:
+        _, scope, direction, cursor_str = query.data.split(":")
+        cursor = int(cursor_str)
+    except ValueError:
+        await query.edit_message_text("داده‌ی نامعتبر.")
+        return
+
+    if scope not in LIST_TITLES:
+        await query.edit_message_text("داده‌ی نامعتبر.")
+        return
+
+    before_id = cursor if direction == "older" else None
+    after_id = cursor if direction == "newer" else None
+
+    orders, has_older, has_newer = await _fetch_orders_page(
+        context, scope, before_id, after_id
+    )
+    if not orders:
+        await query.edit_message_text("سفارش دیگری در این صفحه نیست.")
+        return
+
+    text, keyboard = _orders_list_view(
+        LIST_TITLES[scope], orders, has_older, has_newer, scope
+    )
+    await query.edit_message_text(text, reply_markup=keyboard)
+
+
+# ---------- جستجوی سفارش ----------
+async def _send_search_results(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    orders, has_older, has_newer = await _fetch_orders_page(context, "search")
+
+    if not orders:
+        await update.message.reply_text("سفارشی با این مشخصات پیدا نشد 🔍")
+        return
+
+    text, keyboard = _orders_list_view(
+        LIST_TITLES["search"], orders, has_older, has_newer, "search"
+    )
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+
+async def search_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/search <متن> یا دکمه‌ی «جستجوی سفارش»."""
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        return ConversationHandler.END
+
+    if context.args:
+        context.user_data["search_query"] = " ".join(context.args)
+        await _send_search_results(update, context)
+        return ConversationHandler.END
+
+    await update.message.reply_text(
+        "نام، شماره تلفن، کد ملی یا بخشی از آدرس را بنویس (برای لغو: /cancel):"
+    )
+    return SEARCH_QUERY
+
+
+async def got_search_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data["search_query"] = (update.message.text or "").strip()
+    await _send_search_results(update, context)
+    return ConversationHandler.END
+
+
+async def search_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("جستجو لغو شد ✅")
+    return ConversationHandler.END
+
+
+EXPORT_HELP = (
+    "📤 خروجی سفارش‌ها\n\n"
+    "/export [csv|jsonl] [وضعیت] [از YYYY-MM-DD] [تا YYYY-MM-DD]\n"
+    "وضعیت‌ها: " + ", ".join(STATUS_LABELS) + "\n\n"
+    "مثال: /export jsonl done 2024-01-01 2024-03-31"
+)
+
+
+async def export_orders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("شما ادمین نیستید ❌")
+        return
+
+    try:
+        options = parse_export_args(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}\n\n{EXPORT_HELP}")
+        return
+
+    fmt = options.pop("fmt")
+    total = await count_orders_for_export(**options)
+    if not total:
+        await update.message.reply_text("هیچ سفارشی با این فیلترها پیدا نشد 💤")
+        return
+
+    status_msg = await update.message.reply_text(
+        f"⏳ در حال آماده‌سازی خروجی {total} سفارش..."
+    )
+
+    async def on_progress(written: int):
+        await status_msg.edit_text(f"⏳ {written} از {total} سفارش نوشته شد...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f"orders.{fmt}")
+        # utf-8-sig تا اکسل متن فارسی CSV را درست باز کند
+        encoding = "utf-8-sig" if fmt == "csv" else "utf-8"
+        with open(path, "w", encoding=encoding, newline="") as f:
+            written = await export_orders(f, fmt, on_progress=on_progress, **options)
+
+        with open(path, "rb") as f:
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=f,
+                filename=f"orders.{fmt}",
+                caption=f"📤 خروجی {written} سفارش",
+            )
+
+    await status_msg.delete()
+
+
+# بازه‌های /stats: (عنوان، تعداد روز)
+STATS_PERIODS = (
+    ("امروز", 1),
+    ("۷ روز اخیر", 7),
+    ("۳۰ روز اخیر", 30),
+)
+
+
+def _stats_period_text(title: str, summary: dict) -> str:
+    by_status = summary["by_status"]
+    orders = sum(n for n, _, _ in by_status.values())
+    # سفارش‌های لغو شده در فروش حساب نمی‌شوند
+    revenue = sum(r for st, (_, r, _) in by_status.items() if st != "canceled")
+    items = sum(i for st, (_, _, i) in by_status.items() if st != "canceled")
+
+    lines = [f"📅 {title}: {orders} سفارش"]
+    if orders:
+        lines.append(
+            " | ".join(
+                f"{STATUS_LABELS.get(st, st)} {n}" for st, (n, _, _) in by_status.items()
+            )
+        )
+        lines.append(f"💰 فروش: {revenue} تومان | 📦 کالا: {items}")
+    return "\n".join(lines)
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("شما ادمین نیستید ❌")
+        return
+
+    parts = ["📊 آمار فروش\n"]
+    summary = None
+    for title, days in STATS_PERIODS:
+        summary = await sales_summary(days)
+        parts.append(_stats_period_text(title, summary))
+        parts.append("")
+
+    # پرفروش‌ترین‌ها از آخرین (طولانی‌ترین) بازه
+    if summary and summary["top_products"]:
+        parts.append(f"🏆 پرفروش‌ترین‌ها ({STATS_PERIODS[-1][0]}):")
+        for title, quantity, revenue in summary["top_products"]:
+            parts.append(f"- {title} × {quantity} = {revenue} تومان")
+
+    await update.message.reply_text("\n".join(parts).strip())
+
+
+async def update_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """وضعیت صف پردازش آپدیت‌ها (PerUserUpdateProcessor)."""
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("شما ادمین نیستید ❌")
+        return
+
+    processor = context.application.update_processor
+    if not isinstance(processor, PerUserUpdateProcessor):
+        await update.message.reply_text("آپدیت‌ها به‌صورت ترتیبی پردازش می‌شوند.")
+        return
+
+    s = processor.stats()
+    await update.message.reply_text(
+        "⚙️ صف پردازش آپدیت‌ها\n\n"
+        f"در حال اجرا: {s['running']} از {s['concurrency']}\n"
+        f"در صف: {s['waiting']} (بیشترین: {s['max_waiting']})\n"
+        f"کاربران فعال: {s['active_users']} | بیشترین صف یک کاربر: {s['busiest_user_depth']}\n"
+        f"پردازش‌شده: {s['processed']}\n"
+        f"انتظار: میانگین {s['avg_wait_ms']:.1f} | p95 {s['p95_wait_ms']:.1f}"
+        f" | بیشترین {s['max_wait_ms']:.1f} میلی‌ثانیه"
+    )
+
+
 async def admin_menu_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     if not is_admin(user_id):
@@ -168,6 +455,8 @@ async def admin_menu_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await send_latest_orders_list(chat_id, context)
     elif text == "سفارشات تعیین وضعیت نشده":
         await send_unreviewed_orders_list(chat_id, context)
+    elif text == "سفارشات امروز":
+        await send_today_orders_list(chat_id, context)
 
 
 async def admin_view_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -186,47 +475,13 @@ async def admin_view_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("داده‌ی نامعتبر.")
         return
 
-    row = get_order(order_id)
-    if not row:
+    detail = await order_detail_text(order_id, "admin")
+    if not detail:
         await query.edit_message_text("این سفارش پیدا نشد.")
         return
 
-    (
-        o_id,
-        u_id,
-        national_id,
-        full_name,
-        phone,
-        address,
-        desc,
-        status,
-        created_at,
-    ) = row
-    status_label = STATUS_LABELS.get(status, status)
-
-    items = get_order_items(o_id)
-    items_lines = []
-    total = 0
-    if items:
-        items_lines.append("\n🛒 محصولات این سفارش:")
-        for title, qty, price in items:
-            line_total = qty * price
-            total += line_total
-            items_lines.append(f"- {title} × {qty} = {line_total} تومان")
-        items_lines.append(f"\nجمع کل کالاها: {total} تومان")
-    items_text = "\n".join(items_lines)
-
-    text = (
-        f"🧾 جزئیات سفارش #{o_id}\n\n"
-        f"👤 نام: {full_name}\n"
-        f"🆔 کد ملی: {national_id}\n"
-        f"📞 تلفن: {phone}\n"
-        f"📍 آدرس: {address}\n"
-        f"📅 زمان ثبت: {created_at}\n"
-        f"وضعیت فعلی: {status_label}\n"
-        f"\n📝 توضیحات: {desc or '—'}"
-        f"{items_text}"
-    )
+    _, text = detail
+    o_id = order_id
 
     kb = InlineKeyboardMarkup(
         [
@@ -247,12 +502,98 @@ async def admin_view_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     "🔴 لغو شده", callback_data=f"set_status:{o_id}:canceled"
                 ),
             ],
+            [
+                InlineKeyboardButton(
+                    "🕓 تاریخچه‌ی وضعیت", callback_data=f"order_timeline:{o_id}"
+                ),
+            ],
         ]
     )
 
     await query.edit_message_text(text, reply_markup=kb)
 
 
+async def admin_order_timeline(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    user_id = query.from_user.id
+    if not is_admin(user_id):
+        await query.edit_message_text("شما ادمین نیستید ❌")
+        return
+
+    try:
+        _, order_id_str = query.data.split(":")
+        order_id = int(order_id_str)
+    except ValueError:
+        await query.edit_message_text("داده‌ی نامعتبر.")
+        return
+
+    events = await get_order_timeline(order_id)
+    if not events:
+        await query.edit_message_text("تاریخچه‌ای برای این سفارش ثبت نشده.")
+        return
+
+    lines = [f"🕓 تاریخچه‌ی وضعیت سفارش #{order_id}\n"]
+    for i, event in enumerate(events):
+        label = STATUS_LABELS.get(event.new_status, event.new_status)
+        line = f"{format_ts(event.changed_at)} → {label}"
+        if event.changed_by:
+            line += f" (ادمین {event.changed_by})"
+        if i + 1 < len(events):
+            line += f" | {format_duration(events[i + 1].changed_at - event.changed_at)}"
+        lines.append(line)
+
+    kb = InlineKeyboardMarkup(
+        [[InlineKeyboardButton("🔙 بازگشت", callback_data=f"view_order:{order_id}")]]
+    )
+    await query.edit_message_text("\n".join(lines), reply_markup=kb)
+
+
+# پیش‌فرض بازه‌ی /sla (روز)
+SLA_DEFAULT_DAYS = 7
+
+
+async def sla_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/sla [روز] — میانگین و بیشترین مدت ماندن سفارش‌ها در هر وضعیت."""
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("شما ادمین نیستید ❌")
+        return
+
+    args = context.args or []
+    days = SLA_DEFAULT_DAYS
+    if args:
+        arg = normalize_digits(args[0])
+        if not arg.isdigit() or int(arg) < 1:
+            await update.message.reply_text("استفاده: /sla [تعداد روز]")
+            return
+        days = int(arg)
+
+    metrics = await status_durations(now_ts() - days * 86400)
+
+    lines = [f"⏱ زمان‌بندی سفارش‌ها ({days} روز اخیر)\n"]
+    n, avg, longest = metrics["fulfilment"]
+    if n:
+        lines.append(
+            f"از ثبت تا تکمیل: {n} سفارش | میانگین {format_duration(avg)}"
+            f" | بیشترین {format_duration(longest)}"
+        )
+    else:
+        lines.append("در این بازه سفارشی تکمیل نشده.")
+
+    if metrics["by_status"]:
+        lines.append("\nمدت ماندن در هر وضعیت:")
+        for status, (n, avg, longest) in metrics["by_status"].items():
+            label = STATUS_LABELS.get(status, status)
+            lines.append(
+                f"{label}: {n} بار | میانگین {format_duration(avg)}"
+                f" | بیشترین {format_duration(longest)}"
+            )
+
+    await update.message.reply_text("\n".join(lines))
+
+
 async def admin_set_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -269,24 +610,12 @@ async def admin_set_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("داده‌ی نامعتبر.")
         return
 
-    row = get_order(order_id)
-    if not row:
+    order = await get_order(order_id)
+    if not order:
         await query.edit_message_text("این سفارش پیدا نشد.")
         return
 
-    (
-        o_id,
-        u_id,
-        national_id,
-        full_name,
-        phone,
-        address,
-        desc,
-        old_status,
-        created_at,
-    ) = row
-
-    updated = update_order_status(order_id, new_status)
+    updated = await update_order_status(order_id, new_status, changed_by=user_id)
     if not updated:
         await query.edit_message_text("آپدیت وضعیت انجام نشد.")
         return
@@ -299,7 +628,7 @@ async def admin_set_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         await context.bot.send_message(
-            chat_id=u_id,
+            chat_id=order.user_id,
             text=(
                 f"سلام 👋\n"
                 f"وضعیت سفارش شما با کد #{order_id} به «{new_status_label}» تغییر کرد."
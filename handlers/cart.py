@@ -6,7 +6,7 @@ from telegram import (
 )
 from telegram.ext import ContextTypes
 
-from db import get_cart, update_cart_item_quantity, remove_cart_item
+from db_async import get_cart, change_cart_quantity, remove_cart_item
 
 
 async def show_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -14,7 +14,7 @@ async def show_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user_id = query.from_user.id
-    items = get_cart(user_id)
+    items = await get_cart(user_id)
 
     if not items:
         await query.edit_message_text("🧺 سبد خریدت خالیه.")
@@ -24,16 +24,15 @@ async def show_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     total = 0
     kb_rows = []
 
-    for cart_id, product_id, qty, title, price in items:
-        line_total = qty * price
-        total += line_total
-        lines.append(f"{title} × {qty} = {line_total} تومان")
+    for item in items:
+        total += item.line_total
+        lines.append(f"{item.title} × {item.quantity} = {item.line_total} تومان")
 
         kb_rows.append(
             [
-                InlineKeyboardButton("➕", callback_data=f"cart_inc:{cart_id}"),
-                InlineKeyboardButton("➖", callback_data=f"cart_dec:{cart_id}"),
-                InlineKeyboardButton("❌ حذف", callback_data=f"cart_del:{cart_id}"),
+                InlineKeyboardButton("➕", callback_data=f"cart_inc:{item.cart_id}"),
+                InlineKeyboardButton("➖", callback_data=f"cart_dec:{item.cart_id}"),
+                InlineKeyboardButton("❌ حذف", callback_data=f"cart_del:{item.cart_id}"),
             ]
         )
 
@@ -58,26 +57,15 @@ async def cart_modify(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("داده‌ی نامعتبر برای سبد خرید.")
         return
 
-    items = get_cart(user_id)
-    target = None
-    for item in items:
-        if item[0] == cart_id:
-            target = item
-            break
+    if action == "cart_inc":
+        found = await change_cart_quantity(user_id, cart_id, 1) is not None
+    elif action == "cart_dec":
+        found = await change_cart_quantity(user_id, cart_id, -1) is not None
+    else:
+        found = await remove_cart_item(user_id, cart_id)
 
-    if not target:
+    if not found:
         await query.edit_message_text("این آیتم در سبدت پیدا نشد.")
         return
 
-    cart_id_db, product_id, qty, title, price = target
-
-    if action == "cart_inc":
-        new_qty = qty + 1
-        update_cart_item_quantity(cart_id_db, new_qty)
-    elif action == "cart_dec":
-        new_qty = qty - 1
-        update_cart_item_quantity(cart_id_db, new_qty)
-    elif action == "cart_del":
-        remove_cart_item(cart_id_db)
-
     await show_cart(update, context)
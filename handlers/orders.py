@@ -8,14 +8,10 @@ from telegram import (
 )
 from telegram.ext import ContextTypes, ConversationHandler
 
-from db import (
-    create_order,
-    list_orders_by_user,
-    get_order,
-    get_order_items,
+from db_async import (
+    checkout,
+    list_orders_by_user_page,
     get_cart,
-    save_cart_to_order,
-    clear_cart,
 )
 from config import ADMIN_IDS
 from utils.constants import (
@@ -28,8 +24,10 @@ from utils.constants import (
     CONFIRM,
     FULLNAME,
     NATIONAL_ID,
+    PHONE,
     PROVINCES_CITIES,
     STATUS_LABELS,
+    USER_ORDERS_PAGE_SIZE,
 )
 from utils.validators import (
     is_farsi_name,
@@ -37,51 +35,81 @@ from utils.validators import (
     PHONE_RE,
     is_valid_farsi_address_part,
 )
-from keyboards.main_keyboards import make_keyboard
+from keyboards.main_keyboards import make_keyboard, pager_row
+from utils.texts import order_detail_text
+from utils.timeutils import format_ts
 
 
 # ---------- سفارش‌های من ----------
-async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    user_id = user.id
-
-    orders = list_orders_by_user(user_id, limit=10, offset=0)
-
-    if not orders:
-        await update.message.reply_text("هنوز هیچ سفارشی ثبت نکردی 💤")
-        return
-
+def _my_orders_view(rows, has_older: bool, has_newer: bool):
     lines = ["🧾 لیست آخرین سفارش‌های تو:\n"]
     kb_rows = []
 
-    for row in orders:
-        (
-            order_id,
-            u_id,
-            national_id,
-            full_name,
-            phone,
-            address,
-            desc,
-            status,
-            created_at,
-        ) = row
-        status_label = STATUS_LABELS.get(status, status)
-        lines.append(f"#{order_id} | {status_label} | {created_at[:19]}")
+    for o in rows:
+        status_label = STATUS_LABELS.get(o.status, o.status)
+        line = f"#{o.id} | {status_label} | {format_ts(o.created_ts)}"
+        if o.item_count:
+            line += f" | {o.total_amount} تومان"
+        lines.append(line)
         kb_rows.append(
             [
                 InlineKeyboardButton(
-                    f"مشاهده #{order_id}",
-                    callback_data=f"user_view_order:{order_id}",
+                    f"مشاهده #{o.id}",
+                    callback_data=f"user_view_order:{o.id}",
                 )
             ]
         )
 
-    text = "\n".join(lines)
-    keyboard = InlineKeyboardMarkup(kb_rows)
+    nav = pager_row("my_orders_page", rows, has_older, has_newer)
+    if nav:
+        kb_rows.append(nav)
+
+    return "\n".join(lines), InlineKeyboardMarkup(kb_rows)
+
+
+async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    user_id = user.id
+
+    orders, has_older, has_newer = await list_orders_by_user_page(
+        user_id, limit=USER_ORDERS_PAGE_SIZE
+    )
+
+    if not orders:
+        await update.message.reply_text("هنوز هیچ سفارشی ثبت نکردی 💤")
+        return
+
+    text, keyboard = _my_orders_view(orders, has_older, has_newer)
     await update.message.reply_text(text, reply_markup=keyboard)
 
 
+async def my_orders_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    user_id = query.from_user.id
+
+    try:
+        _, direction, cursor_str = query.data.split(":")
+        cursor = int(cursor_str)
+    except ValueError:
+        await query.edit_message_text("داده‌ی نامعتبر.")
+        return
+
+    before_id = cursor if direction == "older" else None
+    after_id = cursor if direction == "newer" else None
+
+    orders, has_older, has_newer = await list_orders_by_user_page(
+        user_id, before_id=before_id, after_id=after_id, limit=USER_ORDERS_PAGE_SIZE
+    )
+    if not orders:
+        await query.edit_message_text("سفارش دیگری در این صفحه نیست.")
+        return
+
+    text, keyboard = _my_orders_view(orders, has_older, has_newer)
+    await query.edit_message_text(text, reply_markup=keyboard)
+
+
 async def user_view_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -96,53 +124,16 @@ async def user_view_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("داده‌ی نامعتبر.")
         return
 
-    row = get_order(order_id)
-    if not row:
+    detail = await order_detail_text(order_id, "user")
+    if not detail:
         await query.edit_message_text("این سفارش پیدا نشد.")
         return
 
-    (
-        o_id,
-        u_id,
-        national_id,
-        full_name,
-        phone,
-        address,
-        desc,
-        status,
-        created_at,
-    ) = row
-
-    if u_id != user_id:
+    owner_id, text = detail
+    if owner_id != user_id:
         await query.edit_message_text("به این سفارش دسترسی نداری ❌")
         return
 
-    status_label = STATUS_LABELS.get(status, status)
-
-    items = get_order_items(o_id)
-    items_lines = []
-    total = 0
-    if items:
-        items_lines.append("\n🛒 محصولات این سفارش:")
-        for title, qty, price in items:
-            line_total = qty * price
-            total += line_total
-            items_lines.append(f"- {title} × {qty} = {line_total} تومان")
-        items_lines.append(f"\nجمع کل کالاها: {total} تومان")
-    items_text = "\n".join(items_lines)
-
-    text = (
-        f"🧾 سفارش #{o_id}\n\n"
-        f"📅 زمان ثبت: {created_at}\n"
-        f"وضعیت: {status_label}\n"
-        f"👤 نام: {full_name}\n"
-        f"🆔 کد ملی: {national_id}\n"
-        f"\n📍 آدرس ارسال: {address}\n"
-        f"📞 تلفن: {phone}\n"
-        f"\n📝 توضیحات: {desc or '—'}"
-        f"{items_text}"
-    )
-
     await query.edit_message_text(text)
 
 
@@ -152,7 +143,7 @@ async def checkout_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user_id = query.from_user.id
-    items = get_cart(user_id)
+    items = await get_cart(user_id)
 
     if not items:
         await query.edit_message_text("🧺 سبد خریدت خالیه، چیزی برای ثبت سفارش نیست.")
@@ -160,10 +151,9 @@ async def checkout_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     lines = ["🛒 سبد خرید شما:\n"]
     total = 0
-    for cart_id, product_id, qty, title, price in items:
-        line_total = qty * price
-        total += line_total
-        lines.append(f"{title} × {qty} = {line_total} تومان")
+    for item in items:
+        total += item.line_total
+        lines.append(f"{item.title} × {item.quantity} = {item.line_total} تومان")
 
     lines.append(f"\nجمع کل: {total} تومان")
     cart_text = "\n".join(lines)
@@ -342,15 +332,7 @@ async def got_desc(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if desc == "-":
         desc = ""
 
-    from_cart = context.user_data.get("from_cart", False)
-    if from_cart:
-        cart_summary = context.user_data.get("cart_summary", "")
-        if cart_summary:
-            if desc:
-                desc = desc + "\n\n---\nسبد خرید:\n" + cart_summary
-            else:
-                desc = "سبد خرید:\n" + cart_summary
-
+    # فقط یادداشت مشتری ذخیره می‌شود؛ اقلام سبد در order_items ثبت می‌شوند
     context.user_data["order"]["description"] = desc
 
     o = context.user_data["order"]
@@ -385,8 +367,12 @@ async def got_desc(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"   پلاک: {plaque}\n"
         f"   توضیحات آدرس: {address_note or '—'}\n"
         f"📝 توضیحات سفارش: {o['description'] or '—'}\n\n"
-        "تایید می‌کنی ثبت بشه؟"
     )
+    if context.user_data.get("from_cart", False):
+        cart_summary = context.user_data.get("cart_summary", "")
+        if cart_summary:
+            summary += cart_summary + "\n\n"
+    summary += "تایید می‌کنی ثبت بشه؟"
 
     kb = InlineKeyboardMarkup(
         [
@@ -434,25 +420,25 @@ async def confirm_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
         o = context.user_data.get("order") or {}
         user_id = query.from_user.id
 
-        order_id = create_order(
+        from_cart = context.user_data.pop("from_cart", False)
+        order_id, total = await checkout(
             user_id=user_id,
             national_id=o.get("national_id", ""),
             full_name=o.get("full_name", ""),
             phone=o.get("phone", ""),
             address=o.get("full_address", ""),
             description=o.get("description", ""),
+            from_cart=from_cart,
         )
 
-        from_cart = context.user_data.pop("from_cart", False)
-        if from_cart:
-            save_cart_to_order(order_id, user_id)
-            clear_cart(user_id)
-
         context.user_data.pop("cart_summary", None)
         context.user_data.pop("cart_total", None)
         context.user_data.pop("order", None)
 
-        await query.edit_message_text(f"✅ سفارشت ثبت شد!\nکد سفارش: #{order_id}")
+        done_text = f"✅ سفارشت ثبت شد!\nکد سفارش: #{order_id}"
+        if from_cart:
+            done_text += f"\nجمع کل: {total} تومان"
+        await query.edit_message_text(done_text)
 
         keyboard = [
             ["ثبت سفارش جدید"],
@@ -479,7 +465,7 @@ async def confirm_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"کاربر: {query.from_user.full_name} ({user_id})"
         )
         if from_cart:
-            admin_text += "\nمنبع: 🛒 سبد خرید"
+            admin_text += f"\nمنبع: 🛒 سبد خرید\nجمع کل: {total} تومان"
 
         for admin_id in ADMIN_IDS:
             try:
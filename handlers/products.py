@@ -1,8 +1,13 @@
 # handlers/products.py
+import os
+import tempfile
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from db import get_product_by_code, create_product
+from db_async import get_product_by_code, create_product, run_db
+from db import product_cache_stats
+from services.catalog_import import import_catalog_file
 from utils.validators import is_admin
 
 
@@ -16,19 +21,18 @@ async def add_test_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
     title = "محصول تستی (نمونه)"
     price = 150000
 
-    existing = get_product_by_code(code)
+    existing = await get_product_by_code(code)
     if existing:
-        pid, pcode, ptitle, pprice, is_active = existing
         await update.message.reply_text(
             f"این محصول تستی قبلاً وجود داره ✅\n\n"
-            f"ID: {pid}\n"
-            f"کد: {pcode}\n"
-            f"عنوان: {ptitle}\n"
-            f"قیمت: {pprice}"
+            f"ID: {existing.id}\n"
+            f"کد: {existing.code}\n"
+            f"عنوان: {existing.title}\n"
+            f"قیمت: {existing.price}"
         )
         return
 
-    pid = create_product(code=code, title=title, price=price)
+    pid = await create_product(code=code, title=title, price=price)
 
     await update.message.reply_text(
         "محصول تستی ساخته شد ✅\n\n"
@@ -37,3 +41,90 @@ async def add_test_product(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"عنوان: {title}\n"
         f"قیمت: {price}"
     )
+
+
+async def cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """آمار hit/miss کش محصولات (فقط ادمین)."""
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("شما ادمین نیستید ❌")
+        return
+
+    stats = product_cache_stats()
+    lines = ["📦 آمار کش محصولات:\n"]
+    for name, s in stats.items():
+        total = s["hits"] + s["misses"]
+        ratio = (s["hits"] / total * 100) if total else 0
+        lines.append(
+            f"{name}: {s['size']} آیتم | hit {s['hits']} | miss {s['misses']} | {ratio:.1f}%"
+        )
+    await update.message.reply_text("\n".join(lines))
+
+
+IMPORT_HELP = (
+    "📥 ورود گروهی محصولات\n\n"
+    "فایل CSV یا JSON/JSONL را با کپشن /import_products بفرست.\n"
+    "ستون‌ها: code, title, price و اختیاری is_active\n\n"
+    "محصولاتی که کدشان در فایل نیست غیرفعال می‌شوند (ردیف‌های ردشده با کد معتبر "
+    "محصولشان را فعال نگه می‌دارند)؛ "
+    "برای جلوگیری از این کار کپشن را /import_products keep بنویس."
+)
+
+
+async def import_products_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("شما ادمین نیستید ❌")
+        return
+
+    await update.message.reply_text(IMPORT_HELP)
+
+
+async def import_products_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """فایل کاتالوگی که ادمین با کپشن /import_products فرستاده."""
+    user_id = update.effective_user.id
+    if not is_admin(user_id):
+        await update.message.reply_text("شما ادمین نیستید ❌")
+        return
+
+    document = update.message.document
+    name = (document.file_name or "").lower()
+    if name.endswith(".csv"):
+        fmt = "csv"
+    elif name.endswith((".json", ".jsonl")):
+        fmt = "json"
+    else:
+        await update.message.reply_text("فقط فایل csv یا json/jsonl پشتیبانی می‌شود.")
+        return
+
+    caption_args = (update.message.caption or "").split()[1:]
+    deactivate_missing = "keep" not in caption_args
+
+    status_msg = await update.message.reply_text("⏳ در حال دریافت و پردازش فایل...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "catalog")
+        tg_file = await document.get_file()
+        await tg_file.download_to_drive(path)
+        try:
+            report = await run_db(import_catalog_file, path, fmt, deactivate_missing)
+        except ValueError as e:
+            await status_msg.edit_text(f"❌ {e}")
+            return
+
+    lines = [
+        "✅ ورود محصولات انجام شد\n",
+        f"جدید: {report['inserted']}",
+        f"به‌روزرسانی: {report['updated']}",
+        f"رد شده: {report['rejected']}",
+        f"غیرفعال شده: {report['deactivated']}",
+    ]
+    if report["kept"]:
+        # محصولات موجودی که ردیفشان رد شد غیرفعال نمی‌شوند و مقدار قبلی را نگه می‌دارند
+        lines.append(f"فعال مانده با وجود خطا: {report['kept']}")
+    lines.append(f"زمان: {report['seconds']:.2f} ثانیه")
+    if report["errors"]:
+        lines.append("\nنمونه خطاها:")
+        lines.extend(report["errors"])
+
+    await status_msg.edit_text("\n".join(lines))
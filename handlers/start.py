@@ -7,7 +7,7 @@ from telegram import (
 )
 from telegram.ext import ContextTypes
 
-from db import get_product_by_code, add_to_cart, list_orders_by_user
+from db_async import get_product_by_code, add_to_cart, user_has_orders
 from utils.validators import is_admin
 from keyboards.main_keyboards import user_main_menu, admin_main_menu
 
@@ -23,18 +23,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if key.startswith("add_"):
             code = key[len("add_") :]  # مثلا: "test_product_1"
 
-            product = get_product_by_code(code)
+            product = await get_product_by_code(code)
             if not product:
                 await update.message.reply_text("محصول مورد نظر پیدا نشد ❌")
                 return
 
-            pid, pcode, title, price, is_active = product
-            if not is_active:
+            if not product.is_active:
                 await update.message.reply_text("این محصول فعلاً غیرفعاله ❌")
                 return
 
             # اضافه کردن به سبد خرید
-            add_to_cart(user_id, pid)
+            await add_to_cart(user_id, product.id)
 
             kb = InlineKeyboardMarkup(
                 [
@@ -58,7 +57,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
 
             await update.message.reply_text(
-                f"✅ «{title}» به سبد خریدت اضافه شد.\n"
+                f"✅ «{product.title}» به سبد خریدت اضافه شد.\n"
                 "می‌تونی خریدت رو ادامه بدی، سبد رو ببینی یا ثبت سفارش کنی:",
                 reply_markup=kb,
             )
@@ -73,7 +72,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=reply_markup,
         )
     else:
-        has_orders = bool(list_orders_by_user(user_id, limit=1, offset=0))
+        has_orders = await user_has_orders(user_id)
         reply_markup = user_main_menu(has_orders)
 
         await update.message.reply_text(
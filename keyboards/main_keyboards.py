@@ -1,5 +1,5 @@
 # keyboards/main_keyboards.py
-from telegram import ReplyKeyboardMarkup
+from telegram import InlineKeyboardButton, ReplyKeyboardMarkup
 
 
 def make_keyboard(options, row_width: int = 3, with_cancel: bool = True):
@@ -41,9 +41,31 @@ def admin_main_menu():
         ["لیست همه سفارشات"],
         ["لیست آخرین سفارشات"],
         ["سفارشات تعیین وضعیت نشده"],
+        ["سفارشات امروز"],
+        ["جستجوی سفارش"],
     ]
     return ReplyKeyboardMarkup(
         keyboard,
         resize_keyboard=True,
         one_time_keyboard=False,
     )
+
+
+def pager_row(prefix: str, rows, has_older: bool, has_newer: bool):
+    """
+    دکمه‌های «جدیدتر/قدیمی‌تر» برای لیست‌های صفحه‌بندی‌شده.
+    cursor (id اولین/آخرین ردیف صفحه) داخل callback_data قرار می‌گیرد:
+    {prefix}:newer:<id> یا {prefix}:older:<id>
+    """
+    row = []
+    if not rows:
+        return row
+    if has_newer:
+        row.append(
+            InlineKeyboardButton("« جدیدتر", callback_data=f"{prefix}:newer:{rows[0].id}")
+        )
+    if has_older:
+        row.append(
+            InlineKeyboardButton("قدیمی‌تر »", callback_data=f"{prefix}:older:{rows[-1].id}")
+        )
+    return row
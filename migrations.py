@@ -0,0 +1,459 @@
+# migrations.py
+"""
+مهاجرت‌های نسخه‌دار اسکیمای دیتابیس.
+
+نسخه‌ی فعلی در جدول schema_version نگه داشته می‌شود و هر مهاجرتی که
+هنوز اجرا نشده، به ترتیب و هر کدام در یک تراکنش جدا روی فایل موجود
+اجرا می‌شود. برای تغییر اسکیما فقط یک تابع جدید به MIGRATIONS اضافه کن؛
+مهاجرت‌های قبلی را هیچ‌وقت تغییر نده.
+"""
+from datetime import datetime
+
+
+def _m001_base_tables(conn):
+    c = conn.cursor()
+
+    # جدول سفارش‌ها
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        national_id TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        address TEXT NOT NULL,
+        description TEXT,
+        status TEXT NOT NULL DEFAULT 'new',
+        created_at TEXT NOT NULL
+    );
+    """)
+
+    # جدول محصولات
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code TEXT NOT NULL UNIQUE,
+        title TEXT NOT NULL,
+        price INTEGER NOT NULL,
+        is_active INTEGER NOT NULL DEFAULT 1
+    );
+    """)
+
+    # جدول سبد خرید
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS cart (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL
+    );
+    """)
+
+    # جدول آیتم‌های هر سفارش
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        product_title TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        price INTEGER NOT NULL
+    );
+    """)
+
+
+def _m002_hot_indexes(conn):
+    c = conn.cursor()
+
+    # ردیف‌های تکراری سبد (یک محصول چند بار برای یک کاربر) قبل از ساخت
+    # ایندکس یکتا در اولین ردیف ادغام می‌شوند.
+    c.execute("""
+    UPDATE cart
+    SET quantity = (
+        SELECT SUM(c2.quantity) FROM cart c2
+        WHERE c2.user_id = cart.user_id AND c2.product_id = cart.product_id
+    )
+    WHERE id IN (
+        SELECT MIN(id) FROM cart
+        GROUP BY user_id, product_id
+        HAVING COUNT(*) > 1
+    );
+    """)
+    c.execute("""
+    DELETE FROM cart
+    WHERE id NOT IN (SELECT MIN(id) FROM cart GROUP BY user_id, product_id);
+    """)
+
+    # سفارش‌های یک کاربر (جدیدترین اول) و لیست بر اساس وضعیت
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id, id);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_id ON orders (status, id);")
+
+    # هر محصول فقط یک ردیف در سبد هر کاربر
+    c.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_cart_user_product
+    ON cart (user_id, product_id);
+    """)
+
+    # آیتم‌های هر سفارش
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_order_items_order_id
+    ON order_items (order_id);
+    """)
+
+
+def _m003_order_totals(conn):
+    c = conn.cursor()
+
+    # جمع مبلغ و تعداد کالاهای هر سفارش، هنگام checkout نوشته می‌شود
+    c.execute("ALTER TABLE orders ADD COLUMN total_amount INTEGER NOT NULL DEFAULT 0;")
+    c.execute("ALTER TABLE orders ADD COLUMN item_count INTEGER NOT NULL DEFAULT 0;")
+
+    # پر کردن سفارش‌های قدیمی از روی order_items
+    c.execute("""
+    UPDATE orders
+    SET total_amount = t.total, item_count = t.items
+    FROM (
+        SELECT order_id, SUM(quantity * price) AS total, SUM(quantity) AS items
+        FROM order_items
+        GROUP BY order_id
+    ) AS t
+    WHERE t.order_id = orders.id;
+    """)
+
+
+def _m004_compact_descriptions(conn):
+    c = conn.cursor()
+
+    # قبلاً متن کامل سبد خرید به انتهای description چسبانده می‌شد:
+    #   "<یادداشت>\n\n---\nسبد خرید:\n<سبد>"  یا  "سبد خرید:\n<سبد>"
+    # اقلام در order_items هستند، پس فقط برای سفارش‌هایی که آیتم دارند حذفش می‌کنیم.
+    marker = "\n\n---\nسبد خرید:\n"
+    c.execute("""
+    UPDATE orders
+    SET description = substr(description, 1, instr(description, ?) - 1)
+    WHERE item_count > 0 AND instr(description, ?) > 0;
+    """, (marker, marker))
+    c.execute("""
+    UPDATE orders
+    SET description = ''
+    WHERE item_count > 0 AND description LIKE ? || '%';
+    """, ("سبد خرید:\n",))
+
+
+# فضای آزادشده فقط با VACUUM (بیرون از تراکنش) به فایل برمی‌گردد
+_m004_compact_descriptions.vacuum = True
+
+
+def _m005_orders_search(conn):
+    c = conn.cursor()
+
+    # ایندکس full-text جدا از جدول orders؛ rowid همان id سفارش است.
+    # مقادیر با تابع normalize_digits (که روی هر اتصال db.py ثبت می‌شود)
+    # نوشته می‌شوند تا «۰۹۱۲» و «0912» یکی باشند.
+    c.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(
+        full_name, phone, national_id, address, description,
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+    """)
+
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS orders_fts_ai AFTER INSERT ON orders BEGIN
+        INSERT INTO orders_fts (rowid, full_name, phone, national_id, address, description)
+        VALUES (
+            new.id,
+            normalize_digits(new.full_name),
+            normalize_digits(new.phone),
+            normalize_digits(new.national_id),
+            normalize_digits(new.address),
+            normalize_digits(new.description)
+        );
+    END;
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS orders_fts_ad AFTER DELETE ON orders BEGIN
+        DELETE FROM orders_fts WHERE rowid = old.id;
+    END;
+    """)
+    # تغییر وضعیت به ایندکس دست نمی‌زند، فقط ستون‌های قابل جستجو
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS orders_fts_au
+    AFTER UPDATE OF full_name, phone, national_id, address, description ON orders
+    BEGIN
+        DELETE FROM orders_fts WHERE rowid = old.id;
+        INSERT INTO orders_fts (rowid, full_name, phone, national_id, address, description)
+        VALUES (
+            new.id,
+            normalize_digits(new.full_name),
+            normalize_digits(new.phone),
+            normalize_digits(new.national_id),
+            normalize_digits(new.address),
+            normalize_digits(new.description)
+        );
+    END;
+    """)
+
+    c.execute("DELETE FROM orders_fts;")
+    c.execute("""
+    INSERT INTO orders_fts (rowid, full_name, phone, national_id, address, description)
+    SELECT
+        id,
+        normalize_digits(full_name),
+        normalize_digits(phone),
+        normalize_digits(national_id),
+        normalize_digits(address),
+        normalize_digits(description)
+    FROM orders;
+    """)
+
+
+def _backfill_rollups(c, day_expr):
+    """
+    پر کردن جدول‌های آمار روزانه از روی سفارش‌های موجود (جدول اصلی و اگر
+    هست بایگانی). day_expr عبارت SQL روز است و {} جای پیشوند جدول می‌آید.
+    """
+    sources = ["main"]
+    row = c.execute(
+        "SELECT 1 FROM archive.sqlite_master WHERE type='table' AND name='orders'"
+    ).fetchone()
+    if row:
+        sources.append("archive")
+
+    for schema in sources:
+        c.execute(f"""
+        INSERT INTO daily_order_stats (day, status, orders, revenue, items)
+        SELECT {day_expr.format('')}, status, COUNT(*), SUM(total_amount), SUM(item_count)
+        FROM {schema}.orders
+        GROUP BY 1, 2
+        ON CONFLICT (day, status) DO UPDATE SET
+            orders = orders + excluded.orders,
+            revenue = revenue + excluded.revenue,
+            items = items + excluded.items;
+        """)
+        c.execute(f"""
+        INSERT INTO daily_product_sales (day, product_title, quantity, revenue)
+        SELECT {day_expr.format('o.')}, i.product_title,
+               SUM(i.quantity), SUM(i.quantity * i.price)
+        FROM {schema}.order_items i
+        JOIN {schema}.orders o ON o.id = i.order_id
+        WHERE o.status != 'canceled'
+        GROUP BY 1, 2
+        ON CONFLICT (day, product_title) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            revenue = revenue + excluded.revenue;
+        """)
+
+
+def _m006_sales_rollups(conn):
+    c = conn.cursor()
+
+    # خلاصه‌ی روزانه برای /stats؛ هنگام checkout و تغییر وضعیت به‌روز می‌شوند
+    # (db._bump_order_stats و db._bump_product_sales). day روز UTC ثبت سفارش است.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS daily_order_stats (
+        day TEXT NOT NULL,
+        status TEXT NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue INTEGER NOT NULL DEFAULT 0,
+        items INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, status)
+    ) WITHOUT ROWID;
+    """)
+    # فروش هر محصول (سفارش‌های لغو شده حساب نمی‌شوند)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS daily_product_sales (
+        day TEXT NOT NULL,
+        product_title TEXT NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        revenue INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_title)
+    ) WITHOUT ROWID;
+    """)
+
+    _backfill_rollups(c, "substr({}created_at, 1, 10)")
+
+
+def _m007_created_ts(conn):
+    c = conn.cursor()
+
+    # زمان ثبت به‌صورت epoch (ثانیه، UTC) برای کوئری بازه‌ای با ایندکس.
+    # created_at برای سازگاری می‌ماند؛ ستون بایگانی در db._sync_archive_schema پر می‌شود.
+    c.execute("ALTER TABLE orders ADD COLUMN created_ts INTEGER NOT NULL DEFAULT 0;")
+    c.execute("UPDATE orders SET created_ts = CAST(strftime('%s', created_at) AS INTEGER);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_ts ON orders (created_ts);")
+
+    # روزهای آمار از UTC به وقت تهران (تابع local_day روی اتصال‌های db.py ثبت می‌شود)
+    c.execute("DELETE FROM daily_order_stats;")
+    c.execute("DELETE FROM daily_product_sales;")
+    _backfill_rollups(c, "local_day(CAST(strftime('%s', {}created_at) AS INTEGER))")
+
+
+def _m008_status_events(conn):
+    c = conn.cursor()
+
+    # تاریخچه‌ی فقط-اضافه‌شونده‌ی وضعیت هر سفارش؛ در همان تراکنش ثبت سفارش و
+    # update_order_status نوشته می‌شود. old_status در رویداد ثبت سفارش NULL است.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS order_status_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL,
+        old_status TEXT,
+        new_status TEXT NOT NULL,
+        changed_at INTEGER NOT NULL,
+        changed_by INTEGER
+    );
+    """)
+    # تاریخچه‌ی یک سفارش و رویداد قبلی هر رویداد
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_status_events_order
+    ON order_status_events (order_id, id);
+    """)
+    # گزارش‌های SLA روی یک بازه‌ی زمانی
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_status_events_changed_at
+    ON order_status_events (changed_at);
+    """)
+
+    # برای سفارش‌های قبلی فقط زمان ثبت معلوم است
+    c.execute("""
+    INSERT INTO order_status_events (order_id, old_status, new_status, changed_at)
+    SELECT id, NULL, 'new', created_ts FROM orders ORDER BY id;
+    """)
+
+
+def _m009_bot_state(conn):
+    c = conn.cursor()
+
+    # user_data هر کاربر (pickle) و مرحله‌ی ConversationHandler ها؛
+    # services/persistence.py فقط ردیف‌های تغییرکرده را می‌نویسد
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS bot_user_data (
+        user_id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL,
+        updated_at INTEGER NOT NULL
+    );
+    """)
+    # key و state به‌صورت JSON (کلید پیش‌فرض PTB: [chat_id, user_id])
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS bot_conversations (
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        state TEXT NOT NULL,
+        updated_at INTEGER NOT NULL,
+        PRIMARY KEY (name, key)
+    ) WITHOUT ROWID;
+    """)
+    # پاک کردن گفتگوهای رها‌شده هنگام شروع
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_bot_user_data_updated
+    ON bot_user_data (updated_at);
+    """)
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_bot_conversations_updated
+    ON bot_conversations (updated_at);
+    """)
+
+
+def _m010_plain_fts_triggers(conn):
+    c = conn.cursor()
+
+    # تریگرهای مهاجرت ۵ تابع normalize_digits را صدا می‌زدند که فقط روی
+    # اتصال‌های db.py ثبت است؛ هر نویسنده‌ی دیگری (sqlite3 خط فرمان، DB browser،
+    # اسکریپت‌های بازیابی) با «no such function» شکست می‌خورد. حالا
+    # db._insert_order ستون‌ها را قبل از نوشتن یکدست می‌کند و تریگرها فقط کپی‌اند.
+    # نتیجه: ردیفی که از بیرون با ارقام فارسی درج شود، با ارقام لاتین پیدا
+    # نمی‌شود؛ بیرون از ربات ارقام را خودت یکدست بنویس.
+    c.execute("DROP TRIGGER IF EXISTS orders_fts_ai;")
+    c.execute("DROP TRIGGER IF EXISTS orders_fts_au;")
+    c.execute("""
+    CREATE TRIGGER orders_fts_ai AFTER INSERT ON orders BEGIN
+        INSERT INTO orders_fts (rowid, full_name, phone, national_id, address, description)
+        VALUES (
+            new.id, new.full_name, new.phone, new.national_id, new.address, new.description
+        );
+    END;
+    """)
+    c.execute("""
+    CREATE TRIGGER orders_fts_au
+    AFTER UPDATE OF full_name, phone, national_id, address, description ON orders
+    BEGIN
+        DELETE FROM orders_fts WHERE rowid = old.id;
+        INSERT INTO orders_fts (rowid, full_name, phone, national_id, address, description)
+        VALUES (
+            new.id, new.full_name, new.phone, new.national_id, new.address, new.description
+        );
+    END;
+    """)
+
+    # سفارش‌های قبلی هم مثل سفارش‌های جدید ذخیره می‌شوند (این مهاجرت روی
+    # اتصال db.py اجرا می‌شود)؛ تریگر بالا ایندکس همان ردیف‌ها را تازه می‌کند
+    c.execute("""
+    UPDATE orders SET
+        full_name = normalize_digits(full_name),
+        phone = normalize_digits(phone),
+        national_id = normalize_digits(national_id),
+        address = normalize_digits(address),
+        description = CASE
+            WHEN description IS NULL THEN NULL ELSE normalize_digits(description)
+        END
+    WHERE full_name != normalize_digits(full_name)
+        OR phone != normalize_digits(phone)
+        OR national_id != normalize_digits(national_id)
+        OR address != normalize_digits(address)
+        OR description != normalize_digits(description);
+    """)
+
+
+# (نسخه، توضیح، تابع)
+MIGRATIONS = [
+    (1, "base tables", _m001_base_tables),
+    (2, "indexes for hot lookups + unique cart rows", _m002_hot_indexes),
+    (3, "denormalized order totals", _m003_order_totals),
+    (4, "strip cart text copied into descriptions", _m004_compact_descriptions),
+    (5, "full-text search over orders", _m005_orders_search),
+    (6, "daily sales rollups", _m006_sales_rollups),
+    (7, "epoch created_ts + tehran-day rollups", _m007_created_ts),
+    (8, "order status event log", _m008_status_events),
+    (9, "persisted conversations and user_data", _m009_bot_state),
+    (10, "fts triggers without custom sql functions", _m010_plain_fts_triggers),
+]
+
+
+def current_version(conn) -> int:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    );
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn) -> int:
+    """مهاجرت‌های اجرا نشده را اعمال می‌کند و نسخه‌ی نهایی را برمی‌گرداند."""
+    version = current_version(conn)
+    conn.commit()
+    vacuum = False
+
+    for number, description, func in MIGRATIONS:
+        if number <= version:
+            continue
+        conn.execute("BEGIN")
+        try:
+            func(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (number, description, datetime.utcnow().isoformat()),
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        version = number
+        vacuum = vacuum or getattr(func, "vacuum", False)
+
+    if vacuum:
+        conn.execute("VACUUM")
+
+    return version
@@ -0,0 +1,93 @@
+# models.py
+"""
+آبجکت‌های سبک برای ردیف‌های دیتابیس.
+
+هر کوئری فقط ستون‌هایی را می‌خواند که نمای مربوطه لازم دارد و نتیجه را
+در یکی از این کلاس‌ها (با __slots__، بدون dict برای هر ردیف) برمی‌گرداند.
+"""
+
+
+class _Row:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        # ستون‌هایی که کوئری نخوانده None می‌مانند
+        for i, name in enumerate(self.__slots__):
+            setattr(self, name, values[i] if i < len(values) else None)
+
+    @classmethod
+    def factory(cls, cursor, row):
+        """برای استفاده به‌عنوان cursor.row_factory"""
+        return cls(*row)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, n) == getattr(other, n) for n in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{n}={getattr(self, n)!r}" for n in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class OrderSummary(_Row):
+    """یک ردیف در لیست سفارش‌ها."""
+
+    __slots__ = (
+        "id",
+        "user_id",
+        "full_name",
+        "status",
+        "created_at",
+        "total_amount",
+        "item_count",
+        "created_ts",
+    )
+
+
+class OrderDetail(_Row):
+    """
+    همه‌ی اطلاعات یک سفارش برای صفحه‌ی جزئیات.
+    items و total فقط توسط get_order_detail پر می‌شوند.
+    """
+
+    __slots__ = (
+        "id",
+        "user_id",
+        "national_id",
+        "full_name",
+        "phone",
+        "address",
+        "description",
+        "status",
+        "created_at",
+        "created_ts",
+        "items",
+        "total",
+    )
+
+
+class OrderItem(_Row):
+    __slots__ = ("title", "quantity", "price")
+
+    @property
+    def line_total(self) -> int:
+        return self.quantity * self.price
+
+
+class CartLine(_Row):
+    __slots__ = ("cart_id", "product_id", "quantity", "title", "price")
+
+    @property
+    def line_total(self) -> int:
+        return self.quantity * self.price
+
+
+class StatusEvent(_Row):
+    """یک ردیف از تاریخچه‌ی وضعیت سفارش (changed_at به epoch)."""
+
+    __slots__ = ("old_status", "new_status", "changed_at", "changed_by")
+
+
+class Product(_Row):
+    __slots__ = ("id", "code", "title", "price", "is_active")
@@ -0,0 +1,22 @@
+# services/archiver.py
+import asyncio
+import logging
+
+import db
+from db_async import run_db
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL_MINUTES
+
+logger = logging.getLogger(__name__)
+
+
+async def archive_loop():
+    """هر ARCHIVE_INTERVAL_MINUTES دقیقه سفارش‌های تمام‌شده‌ی قدیمی را بایگانی می‌کند."""
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL_MINUTES * 60)
+        try:
+            moved = await run_db(db.archive_orders, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE)
+        except Exception:
+            logger.exception("archiving orders failed")
+            continue
+        if moved:
+            logger.info("archived %s orders", moved)
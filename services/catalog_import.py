@@ -0,0 +1,110 @@
+# services/catalog_import.py
+"""
+خواندن فایل کاتالوگ محصولات (CSV یا JSON/JSON Lines) به‌صورت جریانی،
+اعتبارسنجی هر ردیف و ارسال ردیف‌های معتبر به db.import_products.
+
+ستون‌ها: code, title, price و اختیاری is_active
+"""
+import csv
+import json
+import re
+import time
+
+import db
+from utils.validators import normalize_digits
+
+# کد محصول داخل deep link می‌آید: /start add_<code> (حداکثر ۶۴ کاراکتر)
+PRODUCT_CODE_RE = re.compile(r"^[A-Za-z0-9_\-]{1,60}$")
+
+_TRUE = {"1", "true", "yes", "بله", "فعال"}
+_FALSE = {"0", "false", "no", "خیر", "غیرفعال"}
+
+# چند خطای اول برای گزارش به ادمین نگه داشته می‌شود
+MAX_REPORTED_ERRORS = 10
+
+
+def parse_product(raw: dict):
+    """یک ردیف خام را به (code, title, price, is_active) تبدیل می‌کند یا ValueError می‌دهد."""
+    code = str(raw.get("code") or "").strip()
+    if not PRODUCT_CODE_RE.match(code):
+        raise ValueError(f"کد نامعتبر: {code!r}")
+
+    title = str(raw.get("title") or "").strip()
+    if not title:
+        raise ValueError(f"عنوان خالی برای {code}")
+
+    price_text = normalize_digits(str(raw.get("price") or "")).replace(",", "")
+    if not price_text.isdigit():
+        raise ValueError(f"قیمت نامعتبر برای {code}: {raw.get('price')!r}")
+
+    active_raw = raw.get("is_active", 1)
+    active_text = normalize_digits(str(active_raw)).strip().lower()
+    if active_text in _TRUE or active_text == "":
+        is_active = 1
+    elif active_text in _FALSE:
+        is_active = 0
+    else:
+        raise ValueError(f"is_active نامعتبر برای {code}: {active_raw!r}")
+
+    return code, title, int(price_text), is_active
+
+
+def _iter_csv(f):
+    yield from csv.DictReader(f)
+
+
+def _iter_json(f):
+    # JSON Lines جریانی خوانده می‌شود؛ آرایه‌ی JSON معمولی یکجا لود می‌شود
+    first = f.read(1)
+    while first and first.isspace():
+        first = f.read(1)
+    if first == "[":
+        f.seek(0)
+        yield from json.load(f)
+        return
+
+    f.seek(0)
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def import_catalog_file(path: str, fmt: str, deactivate_missing: bool = True) -> dict:
+    """
+    فایل را می‌خواند و در دیتابیس upsert می‌کند (روی executor دیتابیس اجرا شود).
+    fmt: csv یا json (برای .json و .jsonl)
+    """
+    started = time.perf_counter()
+    report = {"rejected": 0, "errors": []}
+    # کد ردیف‌های ردشده (اگر خود کد معتبر بود) تا محصولشان غیرفعال نشود
+    rejected_codes = []
+
+    def valid_rows(records):
+        for line_no, raw in enumerate(records, start=1):
+            try:
+                if not isinstance(raw, dict):
+                    raise ValueError("ردیف باید شیء با کلیدهای code/title/price باشد")
+                yield parse_product(raw)
+            except ValueError as e:
+                report["rejected"] += 1
+                code = str(raw.get("code") or "").strip() if isinstance(raw, dict) else ""
+                if PRODUCT_CODE_RE.match(code):
+                    rejected_codes.append(code)
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append(f"ردیف {line_no}: {e}")
+
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        records = _iter_csv(f) if fmt == "csv" else _iter_json(f)
+        try:
+            stats = db.import_products(
+                valid_rows(records),
+                deactivate_missing=deactivate_missing,
+                keep_codes=rejected_codes,
+            )
+        except (json.JSONDecodeError, csv.Error) as e:
+            raise ValueError(f"فایل قابل خواندن نیست: {e}")
+
+    report.update(stats)
+    report["seconds"] = time.perf_counter() - started
+    return report
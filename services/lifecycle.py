@@ -0,0 +1,43 @@
+# services/lifecycle.py
+"""
+چرخه‌ی اجرای Application وقتی آپدیت‌ها از run_polling نمی‌آیند
+(حالت webhook و پردازه‌های worker).
+"""
+import asyncio
+import signal
+
+from telegram.ext import Application
+
+
+def stop_on_signals(stop_event: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # ویندوز: Ctrl+C به‌صورت KeyboardInterrupt می‌رسد
+            pass
+
+
+async def serve(app: Application, stop_event: asyncio.Event, start_ingress, stop_ingress):
+    """
+    همان چرخه‌ی run_polling (post_init / post_stop / post_shutdown)، ولی آپدیت‌ها
+    از یک ورودی دیگر (webhook یا صف worker) به app.update_queue می‌رسند.
+    تا set شدن stop_event اجرا می‌شود.
+    """
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    try:
+        await app.start()
+        await start_ingress()
+        await stop_event.wait()
+    finally:
+        await stop_ingress()
+        if app.running:
+            await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
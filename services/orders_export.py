@@ -0,0 +1,107 @@
+# services/orders_export.py
+"""
+خروجی گرفتن از سفارش‌ها (CSV یا JSON Lines) برای ادمین.
+
+سفارش‌ها تکه‌تکه (keyset روی id) از بایگانی و جدول اصلی خوانده و مستقیم
+در فایل نوشته می‌شوند؛ مصرف حافظه به تعداد سفارش‌ها بستگی ندارد.
+"""
+import csv
+import json
+import time
+
+import db
+from db_async import run_db, export_orders_chunk
+from config import EXPORT_CHUNK_SIZE
+from utils.constants import STATUS_LABELS
+from utils.validators import normalize_digits
+from utils.timeutils import parse_day
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+# حداقل فاصله‌ی (ثانیه) بین دو به‌روزرسانی پیام پیشرفت
+PROGRESS_INTERVAL = 2.0
+
+
+def parse_export_args(args) -> dict:
+    """
+    آرگومان‌های /export را تفسیر می‌کند؛ ترتیب مهم نیست:
+    csv|jsonl، یکی از وضعیت‌ها، و حداکثر دو تاریخ YYYY-MM-DD (از / تا، به وقت تهران).
+    """
+    options = {"fmt": "csv", "status": None, "date_from": None, "date_to": None}
+    dates = []
+    for arg in args:
+        arg = normalize_digits(arg).strip().lower()
+        if arg in EXPORT_FORMATS:
+            options["fmt"] = arg
+        elif arg in STATUS_LABELS:
+            options["status"] = arg
+        elif arg[:1].isdigit():
+            dates.append(parse_day(arg))
+        else:
+            raise ValueError(f"آرگومان نامعتبر: {arg}")
+
+    if len(dates) > 2:
+        raise ValueError("حداکثر دو تاریخ (از / تا) قابل قبول است.")
+    # مثل /orders_between ترتیب دو تاریخ مهم نیست
+    if dates:
+        options["date_from"] = min(dates)
+    if len(dates) == 2:
+        options["date_to"] = max(dates)
+    return options
+
+
+class _CsvWriter:
+    def __init__(self, f):
+        self._writer = csv.writer(f)
+        self._writer.writerow(db.EXPORT_COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+
+class _JsonLinesWriter:
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, rows):
+        for row in rows:
+            self._f.write(json.dumps(dict(zip(db.EXPORT_COLUMNS, row)), ensure_ascii=False))
+            self._f.write("\n")
+
+
+_WRITERS = {
+    "csv": _CsvWriter,
+    "jsonl": _JsonLinesWriter,
+}
+
+
+async def export_orders(f, fmt, status=None, date_from=None, date_to=None, on_progress=None):
+    """
+    سفارش‌ها را در فایل متنی باز f می‌نویسد و تعداد ردیف‌ها را برمی‌گرداند.
+    on_progress(written) (اختیاری، async) حداکثر هر PROGRESS_INTERVAL ثانیه صدا زده می‌شود.
+    """
+    writer = _WRITERS[fmt](f)
+    filters = {"status": status, "date_from": date_from, "date_to": date_to}
+    written = 0
+    last_report = time.monotonic()
+
+    # بایگانی فقط سفارش‌های قدیمی را دارد، پس اول می‌آید
+    for schema in ("archive", "main"):
+        after_id = None
+        while True:
+            rows = await export_orders_chunk(schema, after_id, EXPORT_CHUNK_SIZE, **filters)
+            if not rows:
+                break
+
+            await run_db(writer.write, rows)
+            written += len(rows)
+            after_id = rows[-1][0]
+
+            if on_progress and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                await on_progress(written)
+
+            if len(rows) < EXPORT_CHUNK_SIZE:
+                break
+
+    return written
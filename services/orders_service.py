@@ -0,0 +1,556 @@
+# services/orders_service.py
+"""
+لایه‌ی repository برای سفارش‌ها، سبد خرید و محصولات.
+
+هندلرها از طریق db_async فقط با این رابط کار می‌کنند؛ پیاده‌سازی با
+STORAGE_BACKEND در config انتخاب می‌شود:
+- sqlite: همان توابع db.py (حالت عادی)
+- memory: همه‌چیز در حافظه با همان رفتار، برای بنچمارک هندلرها بدون هزینه‌ی
+  دیتابیس. بعد از ری‌استارت چیزی باقی نمی‌ماند.
+
+گزارش‌های ادمین (خروجی، آمار فروش، تاریخچه‌ی وضعیت و SLA) هم از همین رابط
+می‌آیند تا با لیست سفارش‌ها یکی باشند. قابلیت‌هایی که مستقیم روی فایل SQLite کار
+می‌کنند (بایگانی، import محصولات، آمار کش و ...) بیرون از این رابط هستند.
+"""
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+
+import db
+from config import STORAGE_BACKEND
+from models import OrderSummary, OrderDetail, OrderItem, CartLine, Product, StatusEvent
+from utils.validators import normalize_digits
+from utils.timeutils import to_ts, now_ts, local_day, local_today, day_range
+
+
+class OrdersRepository(ABC):
+    @abstractmethod
+    def create_order(self, user_id, national_id, full_name, phone, address, description):
+        ...
+
+    @abstractmethod
+    def checkout(
+        self, user_id, national_id, full_name, phone, address, description, from_cart=True
+    ):
+        """برمی‌گرداند: (order_id, total)"""
+
+    @abstractmethod
+    def get_order(self, order_id):
+        ...
+
+    @abstractmethod
+    def get_order_detail(self, order_id):
+        ...
+
+    @abstractmethod
+    def get_order_items(self, order_id):
+        ...
+
+    @abstractmethod
+    def update_order_status(self, order_id, new_status, changed_by=None):
+        """
+        برمی‌گرداند: تعداد ردیف‌های تغییرکرده (۰ یا ۱)
+        changed_by (آیدی ادمین) در تاریخچه‌ی وضعیت ثبت می‌شود.
+        """
+
+    @abstractmethod
+    def list_orders_page(self, before_id=None, after_id=None, limit=20):
+        """برمی‌گرداند: (rows, has_older, has_newer)"""
+
+    @abstractmethod
+    def list_orders_by_status(self, status, before_id=None, after_id=None, limit=20):
+        ...
+
+    @abstractmethod
+    def list_orders_between(self, start_ts, end_ts, before_id=None, after_id=None, limit=20):
+        ...
+
+    @abstractmethod
+    def list_orders_by_user_page(self, user_id, before_id=None, after_id=None, limit=10):
+        ...
+
+    @abstractmethod
+    def user_has_orders(self, user_id):
+        ...
+
+    @abstractmethod
+    def search_orders(self, text, before_id=None, after_id=None, limit=20):
+        ...
+
+
+class CartRepository(ABC):
+    @abstractmethod
+    def add_to_cart(self, user_id, product_id):
+        ...
+
+    @abstractmethod
+    def get_cart(self, user_id):
+        ...
+
+    @abstractmethod
+    def change_cart_quantity(self, user_id, cart_id, delta):
+        """برمی‌گرداند: تعداد جدید (۰ یعنی حذف شد) یا None"""
+
+    @abstractmethod
+    def remove_cart_item(self, user_id, cart_id):
+        ...
+
+    @abstractmethod
+    def clear_cart(self, user_id):
+        ...
+
+
+class ProductsRepository(ABC):
+    @abstractmethod
+    def create_product(self, code, title, price):
+        ...
+
+    @abstractmethod
+    def get_product_by_code(self, code):
+        ...
+
+    @abstractmethod
+    def get_product_by_id(self, product_id):
+        ...
+
+
+class ReportsRepository(ABC):
+    @abstractmethod
+    def count_orders_for_export(self, status=None, date_from=None, date_to=None):
+        ...
+
+    @abstractmethod
+    def export_orders_chunk(
+        self, schema, after_id=None, limit=500, status=None, date_from=None, date_to=None
+    ):
+        """ردیف‌ها به ترتیب db.EXPORT_COLUMNS؛ schema: «main» یا «archive»"""
+
+    @abstractmethod
+    def sales_summary(self, days, top_products=5):
+        ...
+
+    @abstractmethod
+    def get_order_timeline(self, order_id):
+        ...
+
+    @abstractmethod
+    def status_durations(self, since_ts):
+        ...
+
+
+class Storage(OrdersRepository, CartRepository, ProductsRepository, ReportsRepository):
+    pass
+
+
+# ---------------- SQLite ----------------
+
+class SqliteStorage(Storage):
+    """همان توابع db.py (pool اتصال، کش محصولات، FTS و بایگانی)."""
+
+    create_order = staticmethod(db.create_order)
+    checkout = staticmethod(db.checkout)
+    get_order = staticmethod(db.get_order)
+    get_order_detail = staticmethod(db.get_order_detail)
+    get_order_items = staticmethod(db.get_order_items)
+    update_order_status = staticmethod(db.update_order_status)
+    list_orders_page = staticmethod(db.list_orders_page)
+    list_orders_by_status = staticmethod(db.list_orders_by_status)
+    list_orders_between = staticmethod(db.list_orders_between)
+    list_orders_by_user_page = staticmethod(db.list_orders_by_user_page)
+    user_has_orders = staticmethod(db.user_has_orders)
+    search_orders = staticmethod(db.search_orders)
+
+    add_to_cart = staticmethod(db.add_to_cart)
+    get_cart = staticmethod(db.get_cart)
+    change_cart_quantity = staticmethod(db.change_cart_quantity)
+    remove_cart_item = staticmethod(db.remove_cart_item)
+    clear_cart = staticmethod(db.clear_cart)
+
+    create_product = staticmethod(db.create_product)
+    get_product_by_code = staticmethod(db.get_product_by_code)
+    get_product_by_id = staticmethod(db.get_product_by_id)
+
+    count_orders_for_export = staticmethod(db.count_orders_for_export)
+    export_orders_chunk = staticmethod(db.export_orders_chunk)
+    sales_summary = staticmethod(db.sales_summary)
+    get_order_timeline = staticmethod(db.get_order_timeline)
+    status_durations = staticmethod(db.status_durations)
+
+
+# ---------------- حافظه ----------------
+
+def _page(ids, before_id, after_id, limit):
+    """همان صفحه‌بندی keyset در db._orders_page، روی لیست مرتب id ها."""
+    if after_id is not None:
+        start = bisect_right(ids, after_id)
+        chunk = ids[start:start + limit + 1]
+        has_more = len(chunk) > limit
+        return list(reversed(chunk[:limit])), True, has_more
+
+    end = bisect_left(ids, before_id) if before_id is not None else len(ids)
+    chunk = ids[max(0, end - limit - 1):end]
+    has_more = len(chunk) > limit
+    return list(reversed(chunk[-limit:] if limit else [])), has_more, before_id is not None
+
+
+class MemoryStorage(Storage):
+    """
+    پیاده‌سازی کامل در حافظه با همان رفتار SqliteStorage.
+    همه‌ی متدها زیر یک قفل اجرا می‌شوند چون از تردهای executor صدا زده می‌شوند.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._orders = {}  # id -> OrderDetail (بدون items/total)
+        self._order_totals = {}  # id -> (total_amount, item_count)
+        self._order_items = {}  # id -> [OrderItem]
+        self._order_ids = []  # همه‌ی id ها به ترتیب صعودی
+        self._by_user = {}  # user_id -> [id]
+        self._by_status = {}  # status -> [id]
+        self._events = {}  # id -> [StatusEvent]
+        self._next_order_id = 1
+
+        self._products = {}  # id -> Product
+        self._product_codes = {}  # code -> id
+        self._next_product_id = 1
+
+        self._cart = {}  # cart_id -> [user_id, product_id, quantity]
+        self._cart_keys = {}  # (user_id, product_id) -> cart_id
+        self._cart_by_user = {}  # user_id -> [cart_id] (صعودی)
+        self._next_cart_id = 1
+
+    # ----- سفارش‌ها -----
+    def _summary(self, order_id):
+        o = self._orders[order_id]
+        total, count = self._order_totals[order_id]
+        return OrderSummary(
+            o.id, o.user_id, o.full_name, o.status, o.created_at, total, count, o.created_ts
+        )
+
+    def _summaries(self, page):
+        ids, has_older, has_newer = page
+        return [self._summary(i) for i in ids], has_older, has_newer
+
+    def _insert_order(
+        self, user_id, national_id, full_name, phone, address, description, items
+    ):
+        order_id = self._next_order_id
+        self._next_order_id += 1
+
+        now = datetime.utcnow()
+        self._orders[order_id] = OrderDetail(
+            order_id, user_id, national_id, full_name, phone, address,
+            description, "new", now.isoformat(), to_ts(now),
+        )
+        self._events[order_id] = [StatusEvent(None, "new", to_ts(now), None)]
+        self._order_items[order_id] = items
+        total = sum(item.line_total for item in items)
+        self._order_totals[order_id] = (total, sum(item.quantity for item in items))
+        self._order_ids.append(order_id)
+        self._by_user.setdefault(user_id, []).append(order_id)
+        self._by_status.setdefault("new", []).append(order_id)
+        return order_id, total
+
+    def create_order(self, user_id, national_id, full_name, phone, address, description):
+        with self._lock:
+            order_id, _ = self._insert_order(
+                user_id, national_id, full_name, phone, address, description, []
+            )
+            return order_id
+
+    def checkout(
+        self, user_id, national_id, full_name, phone, address, description, from_cart=True
+    ):
+        with self._lock:
+            items = []
+            if from_cart:
+                for line in self._cart_lines(user_id):
+                    items.append(OrderItem(line.title, line.quantity, line.price))
+                self._clear_cart(user_id)
+            return self._insert_order(
+                user_id, national_id, full_name, phone, address, description, items
+            )
+
+    def get_order(self, order_id):
+        with self._lock:
+            o = self._orders.get(order_id)
+            if o is None:
+                return None
+            return OrderDetail(*(getattr(o, n) for n in OrderDetail.__slots__[:10]))
+
+    def get_order_detail(self, order_id):
+        with self._lock:
+            o = self._orders.get(order_id)
+            if o is None:
+                return None
+            detail = OrderDetail(*(getattr(o, n) for n in OrderDetail.__slots__[:10]))
+            detail.items = list(self._order_items[order_id])
+            detail.total = sum(item.line_total for item in detail.items)
+            return detail
+
+    def get_order_items(self, order_id):
+        with self._lock:
+            return list(self._order_items.get(order_id, []))
+
+    def update_order_status(self, order_id, new_status, changed_by=None):
+        with self._lock:
+            o = self._orders.get(order_id)
+            if o is None:
+                return 0
+            if o.status != new_status:
+                self._events[order_id].append(
+                    StatusEvent(o.status, new_status, now_ts(), changed_by)
+                )
+            old_ids = self._by_status[o.status]
+            del old_ids[bisect_left(old_ids, order_id)]
+            insort(self._by_status.setdefault(new_status, []), order_id)
+            o.status = new_status
+        db.invalidate_order_text(order_id)
+        return 1
+
+    def list_orders_page(self, before_id=None, after_id=None, limit=20):
+        with self._lock:
+            return self._summaries(_page(self._order_ids, before_id, after_id, limit))
+
+    def list_orders_by_status(self, status, before_id=None, after_id=None, limit=20):
+        with self._lock:
+            ids = self._by_status.get(status, [])
+            return self._summaries(_page(ids, before_id, after_id, limit))
+
+    def list_orders_between(self, start_ts, end_ts, before_id=None, after_id=None, limit=20):
+        with self._lock:
+            ids = [
+                i for i in self._order_ids
+                if start_ts <= self._orders[i].created_ts < end_ts
+            ]
+            return self._summaries(_page(ids, before_id, after_id, limit))
+
+    def list_orders_by_user_page(self, user_id, before_id=None, after_id=None, limit=10):
+        with self._lock:
+            ids = self._by_user.get(user_id, [])
+            return self._summaries(_page(ids, before_id, after_id, limit))
+
+    def user_has_orders(self, user_id):
+        with self._lock:
+            return bool(self._by_user.get(user_id))
+
+    def search_orders(self, text, before_id=None, after_id=None, limit=20):
+        """مثل FTS: هر کلمه باید پیشوند یکی از کلمه‌های ستون‌های قابل جستجو باشد."""
+        terms = normalize_digits(text).lower().split()
+        if not terms:
+            return [], False, False
+
+        with self._lock:
+            matched = []
+            for order_id in self._order_ids:
+                o = self._orders[order_id]
+                words = normalize_digits(
+                    " ".join(
+                        [o.full_name, o.phone, o.national_id, o.address, o.description or ""]
+                    )
+                ).lower().split()
+                if all(any(w.startswith(t) for w in words) for t in terms):
+                    matched.append(order_id)
+            return self._summaries(_page(matched, before_id, after_id, limit))
+
+    # ----- گزارش‌ها -----
+    # بایگانی ندارد؛ همان نتیجه‌ها را مستقیم از سفارش‌ها حساب می‌کند
+    def _export_ids(self, status, date_from, date_to):
+        start = day_range(date_from)[0] if date_from else None
+        end = day_range(date_to)[1] if date_to else None
+        for order_id in self._order_ids:
+            o = self._orders[order_id]
+            if status and o.status != status:
+                continue
+            if start is not None and o.created_ts < start:
+                continue
+            if end is not None and o.created_ts >= end:
+                continue
+            yield order_id
+
+    def count_orders_for_export(self, status=None, date_from=None, date_to=None):
+        with self._lock:
+            return sum(1 for _ in self._export_ids(status, date_from, date_to))
+
+    def export_orders_chunk(
+        self, schema, after_id=None, limit=500, status=None, date_from=None, date_to=None
+    ):
+        if schema not in ("main", "archive"):
+            raise ValueError(schema)
+        if schema == "archive":
+            return []
+
+        with self._lock:
+            rows = []
+            for order_id in self._export_ids(status, date_from, date_to):
+                if after_id is not None and order_id <= after_id:
+                    continue
+                o = self._orders[order_id]
+                total, count = self._order_totals[order_id]
+                rows.append((
+                    o.id, o.user_id, o.full_name, o.national_id, o.phone, o.address,
+                    o.description, o.status, o.created_at, total, count, o.created_ts,
+                ))
+                if len(rows) >= limit:
+                    break
+            return rows
+
+    def sales_summary(self, days, top_products=5):
+        since = (local_today() - timedelta(days=days - 1)).isoformat()
+        with self._lock:
+            by_status = {}
+            products = {}
+            for order_id in self._order_ids:
+                o = self._orders[order_id]
+                if local_day(o.created_ts) < since:
+                    continue
+                total, count = self._order_totals[order_id]
+                n, revenue, items = by_status.get(o.status, (0, 0, 0))
+                by_status[o.status] = (n + 1, revenue + total, items + count)
+                # مثل daily_product_sales: سفارش لغوشده از فروش کم می‌شود
+                if o.status == "canceled":
+                    continue
+                for item in self._order_items[order_id]:
+                    qty, revenue = products.get(item.title, (0, 0))
+                    products[item.title] = (
+                        qty + item.quantity, revenue + item.line_total
+                    )
+
+        top = sorted(
+            ((title, qty, revenue) for title, (qty, revenue) in products.items() if qty > 0),
+            key=lambda row: row[1],
+            reverse=True,
+        )
+        return {"by_status": by_status, "top_products": top[:top_products]}
+
+    def get_order_timeline(self, order_id):
+        with self._lock:
+            return list(self._events.get(order_id, []))
+
+    def status_durations(self, since_ts):
+        by_status = {}
+        done = []
+        with self._lock:
+            for events in self._events.values():
+                for prev, event in zip(events, events[1:]):
+                    if event.changed_at < since_ts:
+                        continue
+                    by_status.setdefault(prev.new_status, []).append(
+                        event.changed_at - prev.changed_at
+                    )
+                    if event.new_status == "done":
+                        done.append(event.changed_at - events[0].changed_at)
+
+        def metrics(durations):
+            if not durations:
+                return 0, 0, 0
+            return len(durations), int(sum(durations) / len(durations)), max(durations)
+
+        return {
+            "by_status": {status: metrics(d) for status, d in by_status.items()},
+            "fulfilment": metrics(done),
+        }
+
+    # ----- محصولات -----
+    def create_product(self, code, title, price):
+        with self._lock:
+            if code in self._product_codes:
+                raise sqlite3.IntegrityError("UNIQUE constraint failed: products.code")
+            product_id = self._next_product_id
+            self._next_product_id += 1
+            self._products[product_id] = Product(product_id, code, title, price, 1)
+            self._product_codes[code] = product_id
+            return product_id
+
+    def get_product_by_code(self, code):
+        with self._lock:
+            product_id = self._product_codes.get(code)
+            return self._products.get(product_id)
+
+    def get_product_by_id(self, product_id):
+        with self._lock:
+            return self._products.get(product_id)
+
+    # ----- سبد خرید -----
+    def _cart_lines(self, user_id):
+        lines = []
+        for cart_id in self._cart_by_user.get(user_id, ()):
+            _, product_id, qty = self._cart[cart_id]
+            product = self._products.get(product_id)
+            if product:
+                lines.append(CartLine(cart_id, product_id, qty, product.title, product.price))
+        return lines
+
+    def _drop_cart_row(self, cart_id):
+        user_id, product_id, _ = self._cart.pop(cart_id)
+        del self._cart_keys[(user_id, product_id)]
+        ids = self._cart_by_user[user_id]
+        ids.remove(cart_id)
+        if not ids:
+            del self._cart_by_user[user_id]
+
+    def _clear_cart(self, user_id):
+        for cart_id in self._cart_by_user.pop(user_id, ()):
+            _, product_id, _ = self._cart.pop(cart_id)
+            del self._cart_keys[(user_id, product_id)]
+
+    def add_to_cart(self, user_id, product_id):
+        with self._lock:
+            cart_id = self._cart_keys.get((user_id, product_id))
+            if cart_id is not None:
+                self._cart[cart_id][2] += 1
+                return
+            cart_id = self._next_cart_id
+            self._next_cart_id += 1
+            self._cart[cart_id] = [user_id, product_id, 1]
+            self._cart_keys[(user_id, product_id)] = cart_id
+            self._cart_by_user.setdefault(user_id, []).append(cart_id)
+
+    def get_cart(self, user_id):
+        with self._lock:
+            return self._cart_lines(user_id)
+
+    def change_cart_quantity(self, user_id, cart_id, delta):
+        with self._lock:
+            row = self._cart.get(cart_id)
+            if row is None or row[0] != user_id:
+                return None
+            row[2] += delta
+            if row[2] <= 0:
+                self._drop_cart_row(cart_id)
+                return 0
+            return row[2]
+
+    def remove_cart_item(self, user_id, cart_id):
+        with self._lock:
+            row = self._cart.get(cart_id)
+            if row is None or row[0] != user_id:
+                return False
+            self._drop_cart_row(cart_id)
+            return True
+
+    def clear_cart(self, user_id):
+        with self._lock:
+            self._clear_cart(user_id)
+
+
+_BACKENDS = {
+    "sqlite": SqliteStorage,
+    "memory": MemoryStorage,
+}
+
+_storage = None
+
+
+def get_storage() -> Storage:
+    """نمونه‌ی storage انتخاب‌شده در config (یک بار ساخته می‌شود)."""
+    global _storage
+    if _storage is None:
+        try:
+            backend = _BACKENDS[STORAGE_BACKEND]
+        except KeyError:
+            raise ValueError(f"unknown STORAGE_BACKEND: {STORAGE_BACKEND!r}")
+        _storage = backend()
+    return _storage
@@ -0,0 +1,197 @@
+# services/persistence.py
+"""
+ذخیره‌ی user_data و مرحله‌ی ConversationHandler ها در SQLite، تا با ری‌استارت
+یا کرش، ثبت سفارش نیمه‌کاره (FULLNAME … CONFIRM) از همان مرحله ادامه پیدا کند.
+
+PTB هر update_interval ثانیه داده‌ی کاربرهایی را که آپدیت داشته‌اند و
+گفتگوهایی را که مرحله‌شان نوشته شده می‌دهد. این کلاس فقط آن‌هایی را که واقعاً
+عوض شده‌اند (hash نسخه‌ی pickle شده / مرحله‌ی قبلی) نگه می‌دارد و همه را با
+هم در یک تراکنش، از طریق صف نوشتن، ذخیره می‌کند.
+
+در حالت چندپردازه‌ای هر کاربر فقط روی worker خودش بارگذاری می‌شود؛ برای همین
+services/workers.py وقتی persistence روشن است کاربران worker خراب را به
+workerهای دیگر نمی‌فرستد (وگرنه دو worker نسخه‌های مختلف گفتگو را می‌نوشتند).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import pickle
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import db
+import db_async
+from db_async import run_db
+from config import PERSISTENCE_INTERVAL, STORAGE_BACKEND
+from utils.timeutils import now_ts
+
+logger = logging.getLogger(__name__)
+
+
+def persistence_enabled() -> bool:
+    # فقط روی دیتابیس واقعی (نه storage حافظه‌ای بنچمارک)
+    return PERSISTENCE_INTERVAL > 0 and STORAGE_BACKEND == "sqlite"
+
+
+def _digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+
+class SqlitePersistence(BasePersistence):
+    """
+    فقط user_data و گفتگوها؛ chat_data و bot_data در این ربات استفاده نمی‌شوند.
+    owns_user(user_id) (اختیاری، حالت چندپردازه‌ای): فقط کاربرهای همین worker
+    بارگذاری می‌شوند.
+    """
+
+    def __init__(self, update_interval: float = 5, max_age_days: int = 7, owns_user=None):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self._max_age = max_age_days * 86400
+        self._owns_user = owns_user
+
+        # آخرین نسخه‌ی ذخیره‌شده در دیتابیس
+        self._user_digests = {}  # user_id -> hash
+        self._states = {}  # (name, key) -> state
+
+        # تغییرهای منتظر نوشتن
+        self._pending_users = {}  # user_id -> (bytes یا None, hash یا None)
+        self._pending_conversations = {}  # (name, key) -> state یا None
+        self._flush_task = None
+
+    # ----- بارگذاری هنگام شروع -----
+    async def get_user_data(self) -> dict:
+        await run_db(db.prune_bot_state, now_ts() - self._max_age)
+
+        user_data = {}
+        for user_id, blob in await run_db(db.load_user_data):
+            if self._owns_user and not self._owns_user(user_id):
+                continue
+            try:
+                user_data[user_id] = pickle.loads(blob)
+            except Exception:
+                logger.warning("skipping unreadable user_data of %s", user_id)
+                continue
+            self._user_digests[user_id] = _digest(blob)
+        return user_data
+
+    async def get_conversations(self, name: str) -> dict:
+        conversations = {}
+        for key, state in await run_db(db.load_conversations, name):
+            key = tuple(json.loads(key))
+            # کلید پیش‌فرض ConversationHandler: (chat_id, user_id)
+            if self._owns_user and not self._owns_user(key[-1]):
+                continue
+            state = json.loads(state)
+            conversations[key] = state
+            self._states[(name, key)] = state
+        return conversations
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    # ----- تغییرها -----
+    async def update_user_data(self, user_id: int, data: dict):
+        # user_data خالی ردیف را پاک می‌کند
+        blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL) if data else None
+        await self._queue_user(user_id, blob)
+
+    async def drop_user_data(self, user_id: int):
+        await self._queue_user(user_id, None)
+
+    async def _queue_user(self, user_id: int, blob):
+        digest = _digest(blob) if blob is not None else None
+        if digest == self._user_digests.get(user_id):
+            self._pending_users.pop(user_id, None)
+            return
+        self._pending_users[user_id] = (blob, digest)
+        await self._flush_pending()
+
+    async def update_conversation(self, name: str, key, new_state):
+        entry = (name, key)
+        if new_state == self._states.get(entry):
+            self._pending_conversations.pop(entry, None)
+            return
+        self._pending_conversations[entry] = new_state
+        await self._flush_pending()
+
+    async def update_chat_data(self, chat_id: int, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        await self._flush_pending()
+
+    # ----- نوشتن -----
+    async def _flush_pending(self):
+        # همه‌ی update_* های یک دور update_persistence هم‌زمان صدا زده می‌شوند؛
+        # اولی flush را زمان‌بندی می‌کند و بقیه منتظر همان می‌مانند
+        while self._pending_users or self._pending_conversations:
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self._write_pending())
+            await asyncio.shield(self._flush_task)
+
+    async def _write_pending(self):
+        users, self._pending_users = self._pending_users, {}
+        conversations, self._pending_conversations = self._pending_conversations, {}
+        if not users and not conversations:
+            return
+
+        try:
+            await db_async.write_queue.submit(
+                db.WRITE_OPS["save_bot_state"],
+                {user_id: blob for user_id, (blob, _) in users.items()},
+                {
+                    (name, json.dumps(list(key))): (
+                        None if state is None else json.dumps(state)
+                    )
+                    for (name, key), state in conversations.items()
+                },
+                now_ts(),
+            )
+        except Exception:
+            # دور بعد دوباره نوشته می‌شوند، مگر نسخه‌ی تازه‌تری رسیده باشد
+            for user_id, value in users.items():
+                self._pending_users.setdefault(user_id, value)
+            for entry, state in conversations.items():
+                self._pending_conversations.setdefault(entry, state)
+            raise
+
+        for user_id, (_, digest) in users.items():
+            if digest is None:
+                self._user_digests.pop(user_id, None)
+            else:
+                self._user_digests[user_id] = digest
+        for entry, state in conversations.items():
+            if state is None:
+                self._states.pop(entry, None)
+            else:
+                self._states[entry] = state
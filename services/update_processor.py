@@ -0,0 +1,128 @@
+# services/update_processor.py
+"""
+پردازش هم‌زمان آپدیت‌ها با حفظ ترتیب برای هر کاربر.
+
+آپدیت‌های کاربرهای مختلف موازی اجرا می‌شوند (حداکثر concurrency تا)، ولی
+آپدیت‌های یک کاربر به ترتیب رسیدن و یکی‌یکی؛ پس ConversationHandler ها و
+تغییرات سبد خرید همان رفتار حالت ترتیبی را دارند و یک checkout کند فقط
+همان کاربر را منتظر می‌گذارد.
+"""
+import asyncio
+import contextlib
+import time
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# تعداد زمان‌های انتظار اخیر که برای صدک ۹۵ نگه داشته می‌شود
+_WAIT_SAMPLES = 1000
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    concurrency: حداکثر هندلرهای در حال اجرا
+    max_pending: حداکثر آپدیت‌های در جریان (منتظر + در حال اجرا). سمافور خود
+    BaseUpdateProcessor همین عدد است و اسلات اجرا (concurrency) بعد از قفل
+    کاربر گرفته می‌شود، تا آپدیت‌های منتظر یک کاربر پرمشغله اسلات‌ها را اشغال نکنند.
+    """
+
+    def __init__(self, concurrency: int, max_pending: int = 1000):
+        super().__init__(max(concurrency, max_pending))
+        self._concurrency = concurrency
+        self._slots = asyncio.BoundedSemaphore(concurrency)
+        self._user_locks = {}  # key -> [Lock, تعداد آپدیت‌های در جریان این کاربر]
+
+        self._waiting = 0
+        self._running = 0
+        self._max_waiting = 0
+        self._processed = 0
+        self._started = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._recent_waits = deque(maxlen=_WAIT_SAMPLES)
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+            if update.effective_chat:
+                return ("chat", update.effective_chat.id)
+        # آپدیت بدون کاربر و چت: ترتیبی لازم نیست
+        return None
+
+    def _enter(self, key):
+        if key is None:
+            return None
+        entry = self._user_locks.get(key)
+        if entry is None:
+            entry = self._user_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry
+
+    def _leave(self, key, entry):
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._user_locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        queued_at = time.monotonic()
+        started = False
+        self._waiting += 1
+        self._max_waiting = max(self._max_waiting, self._waiting)
+        entry = self._enter(key)
+
+        try:
+            async with entry[0] if entry else contextlib.nullcontext():
+                async with self._slots:
+                    started = True
+                    self._waiting -= 1
+                    self._record_wait(time.monotonic() - queued_at)
+                    self._running += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self._running -= 1
+                        self._processed += 1
+        finally:
+            if not started:
+                # قبل از شروع لغو شد (مثلاً هنگام خاموش شدن)
+                self._waiting -= 1
+                if asyncio.iscoroutine(coroutine):
+                    coroutine.close()
+            self._leave(key, entry)
+
+    def _record_wait(self, seconds: float):
+        self._started += 1
+        self._wait_total += seconds
+        self._wait_max = max(self._wait_max, seconds)
+        self._recent_waits.append(seconds)
+
+    def stats(self) -> dict:
+        """معیارهای صف (زمان‌ها به میلی‌ثانیه)."""
+        recent = sorted(self._recent_waits)
+        p95 = recent[max(0, int(len(recent) * 0.95) - 1)] if recent else 0.0
+        return {
+            "concurrency": self._concurrency,
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_waiting": self._max_waiting,
+            "active_users": len(self._user_locks),
+            "busiest_user_depth": max(
+                (count for _, count in self._user_locks.values()), default=0
+            ),
+            "processed": self._processed,
+            "avg_wait_ms": self._wait_total / self._started * 1000 if self._started else 0.0,
+            "p95_wait_ms": p95 * 1000,
+            "max_wait_ms": self._wait_max * 1000,
+        }
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,207 @@
+# services/webhook.py
+"""
+ورودی HTTP ساده برای حالت webhook (بدون وابستگی اضافه، روی asyncio).
+
+تلگرام (یا reverse proxy جلوی ربات) هر آپدیت را به‌صورت JSON با POST به
+مسیر تنظیم‌شده می‌فرستد. سرور هدر X-Telegram-Bot-Api-Secret-Token را چک
+می‌کند، بدنه را parse می‌کند و on_update(payload) را صدا می‌زند؛ هیچ
+پردازشی منتظر هندلرها نمی‌ماند. برای تست محلی کافی است یک Update JSON را
+با curl به همین آدرس POST کنید.
+"""
+import asyncio
+import hmac
+import json
+import logging
+
+from telegram import Update
+
+from config import WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+# آپدیت‌های تلگرام چند کیلوبایت بیشتر نیستند
+MAX_BODY_BYTES = 1024 * 1024
+# حداکثر تعداد هدرهای یک درخواست
+MAX_HEADERS = 100
+# اتصال keep-alive بی‌کار بعد از این مدت (ثانیه) بسته می‌شود
+IDLE_TIMEOUT = 75
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class _BadRequest(Exception):
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+class WebhookServer:
+    def __init__(
+        self,
+        on_update,
+        host: str,
+        port: int,
+        path: str,
+        secret_token: str = "",
+        max_connections: int = 40,
+    ):
+        # on_update(payload: dict) — async؛ آپدیت را فقط در صف می‌گذارد
+        self._on_update = on_update
+        self._host = host
+        self._port = port
+        self._path = path
+        self._secret = secret_token.encode() if secret_token else None
+        self._slots = asyncio.Semaphore(max(1, max_connections))
+        self._server = None
+
+    @property
+    def port(self) -> int:
+        """پورت واقعی (وقتی port=0 داده شده باشد)."""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self._host, self._port)
+        logger.info("webhook listening on %s:%s%s", self._host, self.port, self._path)
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle(self, reader, writer):
+        if self._slots.locked():
+            # بیشتر از max_connections اتصال هم‌زمان
+            await self._respond(writer, 503, keep_alive=False)
+            writer.close()
+            return
+
+        async with self._slots:
+            try:
+                while True:
+                    try:
+                        keep_alive = await asyncio.wait_for(
+                            self._handle_request(reader, writer), IDLE_TIMEOUT
+                        )
+                    except _BadRequest as e:
+                        await self._respond(writer, e.status, keep_alive=False)
+                        break
+                    if not keep_alive:
+                        break
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+    async def _handle_request(self, reader, writer) -> bool:
+        """یک درخواست روی اتصال؛ برمی‌گرداند آیا اتصال باز بماند."""
+        try:
+            request_line = await reader.readline()
+        except ValueError:
+            # خط طولانی‌تر از limit بافر StreamReader
+            raise _BadRequest(400) from None
+        if not request_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            raise _BadRequest(400) from None
+
+        headers = {}
+        count = 0
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                raise _BadRequest(431) from None
+            if line in (b"\r\n", b"\n", b""):
+                break
+            count += 1
+            if count > MAX_HEADERS:
+                raise _BadRequest(431)
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = (
+            version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        )
+
+        length = headers.get("content-length", "")
+        if not length:
+            if method == "POST":
+                raise _BadRequest(411)
+            length = "0"
+        if not length.isdigit():
+            raise _BadRequest(400)
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            raise _BadRequest(413)
+        body = await reader.readexactly(length)
+
+        status = await self._dispatch(method, target, headers, body)
+        await self._respond(writer, status, keep_alive)
+        return keep_alive
+
+    async def _dispatch(self, method, target, headers, body) -> int:
+        if target.split("?", 1)[0] != self._path:
+            return 404
+        if method != "POST":
+            return 405
+        if self._secret is not None:
+            given = headers.get("x-telegram-bot-api-secret-token", "").encode()
+            if not hmac.compare_digest(given, self._secret):
+                return 403
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400
+        if not isinstance(payload, dict) or not isinstance(payload.get("update_id"), int):
+            return 400
+
+        try:
+            await self._on_update(payload)
+        except Exception:
+            logger.exception("webhook update rejected")
+            return 500
+        return 200
+
+    @staticmethod
+    async def _respond(writer, status: int, keep_alive: bool):
+        reason = _REASONS.get(status, "")
+        body = reason.encode()
+        writer.write(
+            (
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: text/plain\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                f"\r\n"
+            ).encode("latin-1")
+            + body
+        )
+        await writer.drain()
+
+
+async def register_webhook(bot):
+    """آدرس WEBHOOK_URL را با setWebhook ثبت می‌کند؛ اگر خالی باشد کاری نمی‌کند (تست محلی)."""
+    if not WEBHOOK_URL:
+        return
+    await bot.set_webhook(
+        url=WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET or None,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=Update.ALL_TYPES,
+    )
@@ -0,0 +1,374 @@
+# services/workers.py
+"""
+حالت چندپردازه‌ای (WORKERS > 1).
+
+یک پردازه‌ی ورودی آپدیت‌ها را می‌گیرد (webhook یا polling) و بین WORKERS
+پردازه‌ی worker پخش می‌کند. هر worker یک Application کامل با همه‌ی هندلرهاست؛
+وجه مشترک workerها فقط دیتابیس است.
+
+مسیریابی با آیدی کاربر و rendezvous hashing انجام می‌شود: آپدیت‌های یک کاربر
+همیشه به یک worker می‌رسند، پس وضعیت ConversationHandler و cache ها
+سر جایشان می‌مانند.
+
+آپدیت‌ها در خود پردازه‌ی ورودی نگه داشته می‌شوند تا worker پایان پردازششان را
+(با update_id) تأیید کند؛ تأیید بعد از اجرای هندلرها فرستاده می‌شود، پس آپدیتی
+که در صف داخلی Application یا PerUserUpdateProcessor مانده هم با کرش گم نمی‌شود.
+هر worker صف و pipe تازه‌ی خودش را دارد، چون worker ای که وسط get کشته شود قفل
+داخلی صف را برای همیشه نگه می‌دارد؛ worker جایگزین همه‌ی آپدیت‌های تأییدنشده را
+به ترتیب رسیدن دوباره می‌گیرد. تحویل «دست‌کم یک بار» است: آپدیتی که worker وسط
+هندلرش مرده باشد دوباره پردازش می‌شود. اگر پشت سر هم از کار
+بیفتد، موقتاً از چرخه خارج می‌شود و فقط کاربرانِ همان worker (و آپدیت‌های
+تأییدنشده‌شان) بین بقیه پخش می‌شوند؛ وقتی دوباره سالم شد برمی‌گردند. اگر
+گفتگوها ذخیره شوند (services/persistence.py) جابه‌جایی خاموش است و آپدیت‌های
+کاربران آن worker تا برگشتنش در بافر می‌مانند، چون وضعیت گفتگویشان فقط همان‌جاست.
+"""
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+import queue
+import signal
+import sys
+import threading
+import time
+import zlib
+
+from telegram import Bot, Update
+from telegram.error import TelegramError
+from telegram.ext import TypeHandler
+
+from config import (
+    TOKEN,
+    BOT_MODE,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS,
+)
+from services.lifecycle import serve, stop_on_signals
+from services.persistence import persistence_enabled
+from services.webhook import WebhookServer, register_webhook
+
+logger = logging.getLogger(__name__)
+
+# worker ای که در CRASH_WINDOW ثانیه CRASH_LIMIT بار از کار بیفتد از چرخه خارج می‌شود
+CRASH_WINDOW = 60
+CRASH_LIMIT = 3
+# فاصله‌ی (ثانیه) تلاش دوباره برای worker خارج‌شده
+DOWN_BACKOFF = 30
+# worker برگشته بعد از این مدت زنده ماندن، کاربرانش را پس می‌گیرد
+HEALTHY_AFTER = 5
+# گروه هندلر تأیید پردازش؛ بعد از همه‌ی گروه‌های bot.py اجرا می‌شود
+ACK_GROUP = sys.maxsize
+# long polling در پردازه‌ی ورودی (ثانیه)
+POLL_TIMEOUT = 30
+# مهلت بسته شدن workerها هنگام خاموش شدن (ثانیه)
+SHUTDOWN_TIMEOUT = 30
+
+
+# ---------------- مسیریابی ----------------
+def route_key(payload: dict) -> int:
+    """
+    کلید مسیریابی یک آپدیت خام (dict): آیدی کاربر (from / user)،
+    وگرنه آیدی چت، وگرنه update_id. مثل کلید PerUserUpdateProcessor.
+    """
+    for value in payload.values():
+        if not isinstance(value, dict):
+            continue
+        for field in ("from", "user"):
+            user = value.get(field)
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return payload.get("update_id", 0)
+
+
+def pick_worker(key: int, slots) -> int:
+    """
+    rendezvous hashing: بیشترین hash(key, slot) برنده است. با خارج شدن یک
+    slot فقط کلیدهای همان slot جابه‌جا می‌شوند و با برگشتنش همان‌ها برمی‌گردند.
+    """
+    return max(slots, key=lambda slot: zlib.crc32(f"{key}:{slot}".encode()))
+
+
+# ---------------- پردازه‌ی worker ----------------
+def _worker_main(index: int, size: int, inbox, acks):
+    # Ctrl+C به همه‌ی پردازه‌های گروه می‌رسد؛ worker فقط با پیام توقف صف بسته می‌شود
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    import bot  # پردازه‌ی spawn شده؛ هندلرها فقط این‌جا لازم‌اند
+
+    def owns_user(user_id: int) -> bool:
+        return pick_worker(user_id, range(size)) == index
+
+    # فقط worker اول بایگانی دوره‌ای را اجرا می‌کند
+    app = bot.build_application(archive=index == 0, owns_user=owns_user)
+    asyncio.run(_run_worker(app, inbox, acks))
+
+
+async def _run_worker(app, inbox, acks):
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    closing = threading.Event()
+    reader = None
+
+    async def ack(update: Update, context):
+        # آخرین گروه: هندلرهای قبلی (حتی با خطا) تمام شده‌اند؛ پردازه‌ی ورودی
+        # آپدیت را از بافر تأییدنشده‌ها برمی‌دارد
+        acks.send(update.update_id)
+
+    app.add_handler(TypeHandler(Update, ack), group=ACK_GROUP)
+
+    def next_payload():
+        # get با timeout تا thread بعد از توقف منتظر نماند
+        while not closing.is_set():
+            try:
+                return inbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return None
+
+    async def read_inbox():
+        while True:
+            payload = await loop.run_in_executor(None, next_payload)
+            if payload is None:
+                stop_event.set()
+                return
+            await app.update_queue.put(Update.de_json(payload, app.bot))
+
+    async def start_ingress():
+        nonlocal reader
+        reader = asyncio.create_task(read_inbox())
+
+    async def stop_ingress():
+        closing.set()
+        if reader is not None:
+            await reader
+
+    await serve(app, stop_event, start_ingress, stop_ingress)
+
+
+# ---------------- مدیریت workerها ----------------
+class WorkerPool:
+    def __init__(self, size: int, reroute: bool = True):
+        self._ctx = multiprocessing.get_context("spawn")
+        self._size = size
+        # reroute=False: کاربران worker خراب منتظر همان worker می‌مانند
+        self._reroute_on_failure = reroute
+        # صف و pipe رسید هر worker؛ با هر بار راه‌اندازی تازه ساخته می‌شوند
+        self._inboxes = [None] * size
+        self._acks = [None] * size
+        # آپدیت‌های فرستاده‌شده‌ای که worker هنوز پردازششان را تأیید نکرده:
+        # update_id -> payload، به ترتیب ارسال
+        self._unacked = [OrderedDict() for _ in range(size)]
+        self._procs = [None] * size
+        self._started_at = [0.0] * size
+        self._crashes = [[] for _ in range(size)]
+        self._retry_at = [0.0] * size
+        self._live = set(range(size))
+
+    def _spawn(self, slot: int):
+        inbox = self._ctx.Queue()
+        ack_reader, ack_writer = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(slot, self._size, inbox, ack_writer),
+            name=f"worker-{slot}",
+        )
+        proc.start()
+        # نسخه‌ی این پردازه بسته می‌شود تا با مردن worker، pipe به EOF برسد
+        ack_writer.close()
+        self._inboxes[slot] = inbox
+        self._acks[slot] = ack_reader
+        self._procs[slot] = proc
+        self._started_at[slot] = time.monotonic()
+        logger.info("worker %s started (pid %s)", slot, proc.pid)
+
+        # هر چه worker قبلی تأیید نکرده بود، به همان ترتیب دوباره فرستاده می‌شود
+        unacked = self._unacked[slot]
+        for payload in unacked.values():
+            inbox.put(payload)
+        if unacked:
+            logger.info("resent %s unacked updates to worker %s", len(unacked), slot)
+
+    def _retire(self, slot: int):
+        """منابع worker مرده را آزاد می‌کند؛ رسیدهای مانده در pipe اول خوانده می‌شوند."""
+        self._drain_acks(slot)
+        self._acks[slot].close()
+        self._inboxes[slot].cancel_join_thread()
+        self._inboxes[slot].close()
+        self._acks[slot] = self._inboxes[slot] = None
+
+    def _drain_acks(self, slot: int):
+        conn = self._acks[slot]
+        if conn is None:
+            return
+        unacked = self._unacked[slot]
+        try:
+            while conn.poll():
+                # آپدیت‌های کاربرهای مختلف موازی پردازش می‌شوند، پس رسیدها
+                # لزوماً به ترتیب ارسال نیستند
+                unacked.pop(conn.recv(), None)
+        except (EOFError, OSError):
+            pass
+
+    def start(self):
+        for slot in range(self._size):
+            self._spawn(slot)
+
+    def dispatch(self, payload: dict):
+        # اگر همه از چرخه خارج باشند آپدیت در بافر می‌ماند تا یکی برگردد
+        slots = self._live or range(self._size)
+        slot = pick_worker(route_key(payload), slots)
+        self._drain_acks(slot)
+        self._unacked[slot][payload["update_id"]] = payload
+        if self._inboxes[slot] is not None:
+            self._inboxes[slot].put(payload)
+
+    def check(self):
+        """وضعیت workerها را بررسی می‌کند؛ هر ثانیه از پردازه‌ی ورودی صدا زده می‌شود."""
+        now = time.monotonic()
+        for slot, proc in enumerate(self._procs):
+            if proc is None:
+                if now >= self._retry_at[slot]:
+                    self._spawn(slot)
+                continue
+
+            self._drain_acks(slot)
+            if proc.is_alive():
+                if slot not in self._live and now - self._started_at[slot] >= HEALTHY_AFTER:
+                    self._live.add(slot)
+                    logger.info("worker %s healthy again, taking its users back", slot)
+                continue
+
+            crashes = [t for t in self._crashes[slot] if now - t < CRASH_WINDOW]
+            crashes.append(now)
+            self._crashes[slot] = crashes
+            logger.warning("worker %s exited with code %s", slot, proc.exitcode)
+            self._retire(slot)
+
+            if len(crashes) < CRASH_LIMIT:
+                self._spawn(slot)
+                continue
+
+            # پشت سر هم از کار افتاده: تا DOWN_BACKOFF دوباره بالا نمی‌آید
+            self._procs[slot] = None
+            self._retry_at[slot] = now + DOWN_BACKOFF
+            self._crashes[slot] = []
+            if not self._reroute_on_failure:
+                # slot در چرخه می‌ماند؛ dispatch آپدیت‌ها را فقط در بافر نگه می‌دارد
+                logger.error("worker %s keeps crashing, holding its updates", slot)
+                continue
+            # کاربرانش موقتاً به بقیه می‌روند
+            self._live.discard(slot)
+            logger.error("worker %s keeps crashing, rerouting its users", slot)
+            self._reroute(slot)
+
+    def _reroute(self, slot: int):
+        pending, self._unacked[slot] = self._unacked[slot], OrderedDict()
+        for payload in pending.values():
+            self.dispatch(payload)
+        if pending:
+            logger.info("moved %s pending updates from worker %s", len(pending), slot)
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """پیام توقف را می‌فرستد، منتظر می‌ماند و workerهای جامانده را می‌بندد."""
+        procs = [(slot, proc) for slot, proc in enumerate(self._procs) if proc is not None]
+        for slot, proc in procs:
+            if proc.is_alive():
+                self._inboxes[slot].put(None)
+
+        deadline = time.monotonic() + timeout
+        for slot, proc in procs:
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                # SIGTERM در worker نادیده گرفته می‌شود
+                logger.warning("worker %s did not stop in time, killing", slot)
+                proc.kill()
+                proc.join()
+            self._retire(slot)
+        self._procs = [None] * self._size
+
+
+# ---------------- پردازه‌ی ورودی ----------------
+async def _poll_updates(bot: Bot, dispatch):
+    await bot.delete_webhook()
+    offset = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES
+                )
+            except TelegramError:
+                logger.exception("get_updates failed")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                dispatch(update.to_dict())
+                offset = update.update_id + 1
+    finally:
+        if offset is not None:
+            # آپدیت‌های پخش‌شده را تأیید می‌کند تا بعد از راه‌اندازی دوباره تکرار نشوند
+            try:
+                await bot.get_updates(offset=offset, timeout=0, limit=1)
+            except TelegramError:
+                pass
+
+
+async def _supervise(pool: WorkerPool):
+    while True:
+        await asyncio.sleep(1)
+        pool.check()
+
+
+async def _run_ingress(pool: WorkerPool):
+    stop_event = asyncio.Event()
+    stop_on_signals(stop_event)
+
+    async with Bot(TOKEN) as bot:
+        tasks = [asyncio.create_task(_supervise(pool))]
+        server = None
+        if BOT_MODE == "webhook":
+
+            async def on_update(payload: dict):
+                pool.dispatch(payload)
+
+            server = WebhookServer(
+                on_update,
+                WEBHOOK_LISTEN,
+                WEBHOOK_PORT,
+                WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+            await server.start()
+            await register_webhook(bot)
+        else:
+            tasks.append(asyncio.create_task(_poll_updates(bot, pool.dispatch)))
+
+        try:
+            await stop_event.wait()
+        finally:
+            if server is not None:
+                await server.stop()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_worker_pool(size: int):
+    """ورودی + size پردازه‌ی worker؛ تا SIGINT / SIGTERM اجرا می‌شود."""
+    # وضعیت گفتگوی ذخیره‌شده‌ی هر کاربر فقط روی worker خودش معتبر است
+    pool = WorkerPool(size, reroute=not persistence_enabled())
+    pool.start()
+    try:
+        asyncio.run(_run_ingress(pool))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
@@ -0,0 +1,112 @@
+# services/write_queue.py
+"""
+صف نوشتن با group commit.
+
+هندلرها به‌جای یک تراکنش (و یک fsync) برای هر کلیک، عملیات نوشتن را در
+صف می‌گذارند. یک task نویسنده هر چه در صف جمع شده (حداکثر max_batch عملیات،
+و حداکثر max_latency ثانیه صبر برای رسیدن بقیه) را با db.run_write_batch
+در یک تراکنش اجرا می‌کند و future هر درخواست را با نتیجه‌ی خودش کامل می‌کند.
+"""
+import asyncio
+import logging
+
+import db
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    def __init__(self, run_db, max_batch: int = 64, max_latency: float = 0.005):
+        # run_db: اجرای تابع همگام روی executor دیتابیس (db_async.run_db)
+        self._run_db = run_db
+        self._max_batch = max(1, max_batch)
+        self._max_latency = max(0.0, max_latency)
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """task نویسنده را روی event loop فعلی راه می‌اندازد."""
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name="db-write-queue")
+
+    async def stop(self):
+        """عملیات‌های باقی‌مانده‌ی صف را می‌نویسد و task را متوقف می‌کند."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, op, *args, **kwargs):
+        """op(cur, ...) را در دسته‌ی بعدی اجرا می‌کند و نتیجه‌اش را برمی‌گرداند."""
+        if not self.running:
+            # قبل از start یا بعد از stop: تراکنش جدا مثل قبل
+            return await self._run_db(db.run_write, op, *args, **kwargs)
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((op, args, kwargs, future))
+        return await future
+
+    async def _collect(self, first):
+        """اولین عملیات + هر چه تا پر شدن دسته یا تمام شدن max_latency برسد."""
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._max_latency
+        stop = False
+
+        while len(batch) < self._max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+
+        return batch, stop
+
+    async def _run(self):
+        stop = False
+        while not stop:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch, stop = await self._collect(first)
+
+            ops = [(op, args, kwargs) for op, args, kwargs, _ in batch]
+            try:
+                results = await self._run_db(db.run_write_batch, ops)
+            except Exception as e:
+                # خطای کل تراکنش (مثلاً قفل دیتابیس): همه‌ی درخواست‌های دسته خطا می‌گیرند
+                logger.exception("write batch of %s ops failed", len(batch))
+                results = [(False, e)] * len(batch)
+
+            for (_, _, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+        # هر چه بعد از سیگنال توقف مانده، بدون دسته‌بندی نوشته می‌شود
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is None:
+                continue
+            op, args, kwargs, future = item
+            try:
+                future.set_result(await self._run_db(db.run_write, op, *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
@@ -0,0 +1,78 @@
+# utils/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    کش LRU با انقضای زمانی و شمارنده‌ی hit/miss.
+    thread-safe است چون توابع db روی تردهای executor اجرا می‌شوند.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # نسخه‌ی باطل‌سازی: key -> شماره‌ی آخرین pop (فقط maxsize تای اخیر)؛
+        # کلیدهای دیگر نسخه‌ی floor را دارند که با clear و دور ریختن بالا می‌رود
+        self._version = 0
+        self._floor = 0
+        self._invalidated = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def token(self, key):
+        """
+        نسخه‌ی فعلی key؛ قبل از خواندن مقدار از منبع گرفته و به set داده می‌شود
+        تا اگر key وسط خواندن باطل شد، مقدار کهنه کش نشود.
+        """
+        with self._lock:
+            return self._invalidated.get(key, self._floor)
+
+    def set(self, key, value, token=None):
+        with self._lock:
+            if token is not None and self._invalidated.get(key, self._floor) != token:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._version += 1
+            self._invalidated[key] = self._version
+            self._invalidated.move_to_end(key)
+            if len(self._invalidated) > self.maxsize:
+                self._invalidated.popitem(last=False)
+                # token های قدیمی‌تر کلید دورریخته‌شده هم باید نامعتبر شوند
+                self._floor = self._version
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._invalidated.clear()
+            self._version += 1
+            self._floor = self._version
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -12,6 +12,9 @@
     CONFIRM,
 ) = range(10)
 
+# مرحله‌ی گفتگوی جستجوی سفارش (ادمین)
+SEARCH_QUERY = 10
+
 
 # لیست استان‌ها و شهرها برای دکمه‌ها
 PROVINCES_CITIES = {
@@ -115,3 +118,7 @@ STATUS_LABELS = {
     "canceled": "🔴 لغو شده",
 }
 
+
+# تعداد سفارش در هر صفحه‌ی لیست‌ها
+ADMIN_ORDERS_PAGE_SIZE = 20
+USER_ORDERS_PAGE_SIZE = 10
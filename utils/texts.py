@@ -0,0 +1,75 @@
+# utils/texts.py
+from db import order_text_cache
+from db_async import get_order_detail
+from utils.cache import MISSING
+from utils.constants import STATUS_LABELS
+from utils.timeutils import format_ts
+
+
+def _items_text(order) -> str:
+    if not order.items:
+        return ""
+
+    lines = ["\n🛒 محصولات این سفارش:"]
+    for item in order.items:
+        lines.append(f"- {item.title} × {item.quantity} = {item.line_total} تومان")
+    lines.append(f"\nجمع کل کالاها: {order.total} تومان")
+    return "\n".join(lines)
+
+
+def render_admin_order(order) -> str:
+    status_label = STATUS_LABELS.get(order.status, order.status)
+    return (
+        f"🧾 جزئیات سفارش #{order.id}\n\n"
+        f"👤 نام: {order.full_name}\n"
+        f"🆔 کد ملی: {order.national_id}\n"
+        f"📞 تلفن: {order.phone}\n"
+        f"📍 آدرس: {order.address}\n"
+        f"📅 زمان ثبت: {format_ts(order.created_ts)}\n"
+        f"وضعیت فعلی: {status_label}\n"
+        f"\n📝 توضیحات: {order.description or '—'}"
+        f"{_items_text(order)}"
+    )
+
+
+def render_user_order(order) -> str:
+    status_label = STATUS_LABELS.get(order.status, order.status)
+    return (
+        f"🧾 سفارش #{order.id}\n\n"
+        f"📅 زمان ثبت: {format_ts(order.created_ts)}\n"
+        f"وضعیت: {status_label}\n"
+        f"👤 نام: {order.full_name}\n"
+        f"🆔 کد ملی: {order.national_id}\n"
+        f"\n📍 آدرس ارسال: {order.address}\n"
+        f"📞 تلفن: {order.phone}\n"
+        f"\n📝 توضیحات: {order.description or '—'}"
+        f"{_items_text(order)}"
+    )
+
+
+_RENDERERS = {
+    "admin": render_admin_order,
+    "user": render_user_order,
+}
+
+
+async def order_detail_text(order_id: int, view: str):
+    """
+    متن صفحه‌ی جزئیات سفارش برای view («admin» یا «user»).
+    اگر در کش باشد هیچ کوئری‌ای زده نمی‌شود.
+    برمی‌گرداند: (owner_user_id, text) یا None اگر سفارش پیدا نشد.
+    """
+    key = (order_id, view)
+    cached = order_text_cache.get(key)
+    if cached is not MISSING:
+        return cached
+
+    # اگر وضعیت وسط خواندن عوض شود، متن کهنه کش نمی‌شود
+    token = order_text_cache.token(key)
+    order = await get_order_detail(order_id)
+    if not order:
+        return None
+
+    cached = (order.user_id, _RENDERERS[view](order))
+    order_text_cache.set(key, cached, token)
+    return cached
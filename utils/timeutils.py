@@ -0,0 +1,82 @@
+# utils/timeutils.py
+"""
+زمان ثبت سفارش در دیتابیس به‌صورت epoch (ثانیه، UTC) در ستون created_ts
+ذخیره می‌شود. «روز» در گزارش‌ها و فیلترها و همه‌ی نمایش‌ها به وقت تهران است.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from utils.validators import normalize_digits
+
+try:
+    TEHRAN = ZoneInfo("Asia/Tehran")
+except ZoneInfoNotFoundError:
+    # سیستم بدون دیتابیس tz (مثلاً ویندوز بدون پکیج tzdata)؛
+    # ایران از ۱۴۰۱ ساعت تابستانی ندارد
+    TEHRAN = timezone(timedelta(hours=3, minutes=30))
+
+
+def to_ts(dt: datetime) -> int:
+    """datetime بدون tz (UTC، مثل خروجی utcnow) یا با tz را به epoch تبدیل می‌کند."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def now_ts() -> int:
+    return to_ts(datetime.now(timezone.utc))
+
+
+def to_local(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts, TEHRAN)
+
+
+def format_ts(ts, fmt: str = "%Y-%m-%d %H:%M") -> str:
+    """نمایش epoch به وقت تهران."""
+    if not ts:
+        return "—"
+    return to_local(ts).strftime(fmt)
+
+
+def local_day(ts: int) -> str:
+    """روز (YYYY-MM-DD) به وقت تهران؛ روی اتصال‌های db.py به‌عنوان تابع SQL هم ثبت می‌شود."""
+    return to_local(ts).date().isoformat()
+
+
+def local_today() -> date:
+    return datetime.now(TEHRAN).date()
+
+
+def day_start_ts(day: date) -> int:
+    """epoch نیمه‌شب ابتدای day به وقت تهران."""
+    return to_ts(datetime.combine(day, time.min, TEHRAN))
+
+
+def day_range(first: date, last: date = None):
+    """
+    بازه‌ی [شروع first, شروع روز بعد از last) به epoch، برای کوئری روی created_ts.
+    اگر last داده نشود فقط همان یک روز.
+    """
+    last = last or first
+    return day_start_ts(first), day_start_ts(last + timedelta(days=1))
+
+
+def format_duration(seconds: int) -> str:
+    """مدت زمان خوانا، مثل «۲ روز ۳ ساعت» یا «۱۵ دقیقه» (دو واحد بزرگ‌تر)."""
+    seconds = int(seconds or 0)
+    parts = []
+    for size, label in ((86400, "روز"), (3600, "ساعت"), (60, "دقیقه")):
+        if seconds >= size:
+            parts.append(f"{seconds // size} {label}")
+            seconds %= size
+    if not parts:
+        return f"{seconds} ثانیه"
+    return " ".join(parts[:2])
+
+
+def parse_day(text: str) -> date:
+    """«YYYY-MM-DD» (با رقم فارسی یا انگلیسی) را به date تبدیل می‌کند."""
+    try:
+        return date.fromisoformat(normalize_digits(text))
+    except ValueError:
+        raise ValueError(f"تاریخ نامعتبر: {text} (قالب درست: YYYY-MM-DD)") from None